@@ -53,8 +53,3 @@ variable "deployment_version" {
   type      = string
   sensitive = true
 }
-
-variable "sfn_max_concurrency" {
-  default   = 1
-  type      = number
-}
\ No newline at end of file
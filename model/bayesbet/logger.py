@@ -1,8 +1,11 @@
 import logging
+import os
 
 
 def get_logger(name):
-    if logging.getLogger().hasHandlers():
+    # The Lambda runtime installs a root handler that fills in aws_request_id
+    in_lambda = "AWS_LAMBDA_FUNCTION_NAME" in os.environ
+    if in_lambda and logging.getLogger().hasHandlers():
         log_fmt = f"[%(levelname)s]\t%(asctime)s.%(msecs)dZ\t%(aws_request_id)s\t{name}\t%(message)s\n"
         logger = logging.getLogger()
         logger.setLevel(logging.INFO)
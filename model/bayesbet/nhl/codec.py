@@ -0,0 +1,267 @@
+from datetime import date
+import importlib.util
+import zlib
+
+import numpy as np
+import simplejson as json
+
+from bayesbet.nhl.data_model import (
+    GameOutcome,
+    GamePrediction,
+    LeagueState,
+    ModelState,
+    ModelStateRecord,
+    ModelVariables,
+    PredictionPerformance,
+    PredictionRecord,
+    ScoreProbabilities,
+    TeamState,
+    TeamWinPercentage,
+    WinPercentages,
+    precision,
+)
+
+# orjson is an optional dependency, the codec falls back to simplejson
+if importlib.util.find_spec("orjson") is not None:
+    import orjson
+else:
+    orjson = None
+
+# The decimal places of the data model's field serializers
+digits = int(precision.strip(".f"))
+sides = ("home", "away")
+outcomes = ("regulation", "overtime", "shootout")
+performance_columns = (
+    "cumulative_accuracy",
+    "cumulative_log_loss",
+    "rolling_accuracy",
+    "rolling_log_loss",
+)
+
+
+def rounded(values):
+    """A float64 array rounded to the data model's precision."""
+    return np.round(np.asarray(values, dtype=np.float64), digits)
+
+
+def encode_league_state(league_state: LeagueState) -> dict:
+    teams = list(league_state.teams.keys())
+    team_params = [(*s.o, *s.d) for s in league_state.teams.values()]
+    return {
+        "h": rounded(league_state.h),
+        "i": rounded(league_state.i),
+        "teams": teams,
+        # (team, (o_μ, o_σ, d_μ, d_σ))
+        "team_params": rounded(team_params).reshape(len(teams), 4),
+    }
+
+
+def encode_model_state(model_state: ModelState) -> dict:
+    variables = model_state.variables
+    return {
+        "teams": model_state.teams,
+        "h": rounded(variables.h),
+        "i": rounded(variables.i),
+        "o": rounded(variables.o),
+        "d": rounded(variables.d),
+    }
+
+
+def encode_predictions(predictions: list[GamePrediction]) -> dict:
+    return {
+        "game_pk": [p.game_pk for p in predictions],
+        "home_team": [p.home_team for p in predictions],
+        "away_team": [p.away_team for p in predictions],
+        "home_score": [p.outcome.home_score for p in predictions],
+        "away_score": [p.outcome.away_score for p in predictions],
+        # (game, (home, away), goals)
+        "score_probabilities": rounded([
+            (p.score_probabilities.home, p.score_probabilities.away)
+            for p in predictions
+        ]),
+        # (game, (home, away), (regulation, overtime, shootout))
+        "win_percentages": rounded([
+            [
+                [win_p.regulation, win_p.overtime, win_p.shootout]
+                for win_p in (p.win_percentages.home, p.win_percentages.away)
+            ]
+            for p in predictions
+        ]),
+    }
+
+
+def encode_performance(performance: list[PredictionPerformance]) -> dict:
+    return {
+        "prediction_date": [p.prediction_date.strftime("%Y-%m-%d") for p in performance],
+        "total_games": [p.total_games for p in performance],
+        **{
+            column: rounded([getattr(p, column) for p in performance])
+            for column in performance_columns
+        },
+    }
+
+
+def encode(record: PredictionRecord | ModelStateRecord) -> dict:
+    """
+    A record as a columnar dict of lists and NumPy arrays, with the floats
+    rounded to the data model's precision in one step per array.
+    """
+    if not isinstance(record, (PredictionRecord, ModelStateRecord)):
+        raise TypeError(f"No codec for records of type {type(record).__name__}!")
+    encoded = {
+        "league": record.league,
+        "prediction_date": record.prediction_date.strftime("%Y-%m-%d"),
+    }
+    if isinstance(record, ModelStateRecord):
+        encoded["state"] = encode_model_state(record.state)
+    else:
+        encoded["deployment_version"] = record.deployment_version
+        encoded["league_state"] = encode_league_state(record.league_state)
+        encoded["predictions"] = encode_predictions(record.predictions)
+        encoded["prediction_performance"] = encode_performance(
+            record.prediction_performance
+        )
+    return encoded
+
+
+def validated(cls, **fields):
+    return cls.model_validate(fields)
+
+
+def constructed(cls, **fields):
+    return cls.model_construct(**fields)
+
+
+def decode_league_state(data, build) -> LeagueState:
+    team_params = rounded(data["team_params"]).reshape(-1, 4).tolist()
+    teams = {
+        t: build(TeamState, o=(o_μ, o_σ), d=(d_μ, d_σ))
+        for t, (o_μ, o_σ, d_μ, d_σ) in zip(data["teams"], team_params)
+    }
+    return build(
+        LeagueState,
+        i=tuple(rounded(data["i"]).tolist()),
+        h=tuple(rounded(data["h"]).tolist()),
+        teams=teams,
+    )
+
+
+def decode_model_state(data, build) -> ModelState:
+    variables = build(
+        ModelVariables,
+        **{v: tuple(rounded(data[v]).tolist()) for v in ("i", "h", "o", "d")},
+    )
+    return build(ModelState, teams=list(data["teams"]), variables=variables)
+
+
+def decode_predictions(data, build) -> list[GamePrediction]:
+    score_p = rounded(data["score_probabilities"]).tolist()
+    win_p = rounded(data["win_percentages"]).tolist()
+    games = zip(
+        data["game_pk"],
+        data["home_team"],
+        data["away_team"],
+        data["home_score"],
+        data["away_score"],
+        score_p,
+        win_p,
+    )
+    return [
+        build(
+            GamePrediction,
+            game_pk=game_pk,
+            home_team=home_team,
+            away_team=away_team,
+            outcome=build(GameOutcome, home_score=home_score, away_score=away_score),
+            score_probabilities=build(ScoreProbabilities, **dict(zip(sides, game_score_p))),
+            win_percentages=build(WinPercentages, **{
+                side: build(TeamWinPercentage, **dict(zip(outcomes, side_win_p)))
+                for side, side_win_p in zip(sides, game_win_p)
+            }),
+        )
+        for game_pk, home_team, away_team, home_score, away_score, game_score_p, game_win_p in games
+    ]
+
+
+def decode_performance(data, build) -> list[PredictionPerformance]:
+    columns = [rounded(data[c]).tolist() for c in performance_columns]
+    return [
+        build(
+            PredictionPerformance,
+            prediction_date=date.fromisoformat(prediction_date),
+            total_games=total_games,
+            **dict(zip(performance_columns, values)),
+        )
+        for prediction_date, total_games, *values in zip(
+            data["prediction_date"], data["total_games"], *columns
+        )
+    ]
+
+
+def decode(cls, data: dict, trusted=False):
+    """
+    Builds a record of type cls from encode output, with the floats rounded
+    to the data model's precision. trusted=True builds the models with
+    model_construct, skipping all validation, for records the pipeline
+    itself just produced.
+    """
+    build = constructed if trusted else validated
+    fields = {
+        "league": data["league"],
+        "prediction_date": date.fromisoformat(data["prediction_date"]),
+    }
+    if cls is ModelStateRecord:
+        fields["state"] = decode_model_state(data["state"], build)
+    elif cls is PredictionRecord:
+        fields["deployment_version"] = data["deployment_version"]
+        fields["league_state"] = decode_league_state(data["league_state"], build)
+        fields["predictions"] = decode_predictions(data["predictions"], build)
+        fields["prediction_performance"] = decode_performance(
+            data["prediction_performance"], build
+        )
+    else:
+        raise TypeError(f"No codec for records of type {cls.__name__}!")
+    return build(cls, **fields)
+
+
+def is_columnar(data: dict) -> bool:
+    """
+    Whether parsed JSON is encode output, rather than a record's
+    model_dump as the pipeline wrote before the codec.
+    """
+    if "state" in data:
+        return "variables" not in data["state"]
+    return isinstance(data.get("predictions"), dict)
+
+
+def dumps(record: PredictionRecord | ModelStateRecord, binary=False) -> bytes:
+    """
+    Serializes a record to columnar JSON bytes, written by orjson straight
+    from the NumPy arrays if it is installed. With binary=True the JSON is
+    zlib compressed.
+    """
+    encoded = encode(record)
+    if orjson is not None:
+        data = orjson.dumps(encoded, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        # Compact separators, so the bytes are the same as orjson's
+        data = json.dumps(
+            encoded, default=np.ndarray.tolist, separators=(",", ":")
+        ).encode("utf-8")
+    if binary:
+        # The fastest level, most of the gain is in the repeated keys and digits
+        return zlib.compress(data, 1)
+    return data
+
+
+def loads(cls, data: bytes | str, binary=False, trusted=False):
+    """
+    Deserializes a record of type cls from dumps output. JSON written before
+    the codec, one field per float, is validated by pydantic as it was then.
+    """
+    if binary:
+        data = zlib.decompress(data)
+    parsed = orjson.loads(data) if orjson is not None else json.loads(data)
+    if not is_columnar(parsed):
+        return cls.model_validate_json(data)
+    return decode(cls, parsed, trusted=trusted)
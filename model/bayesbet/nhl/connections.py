@@ -0,0 +1,89 @@
+"""
+The AWS clients of the pipeline, created on first use and cached per
+(region, endpoint) for the life of the process. The tasks of one run, and
+the runs of a warm Lambda container or of the local runner, reuse the
+same credentials and connection pools. Tests swap in a local stand-in
+with use_dynamodb_resource or use_s3_filesystem.
+"""
+import os
+
+import boto3
+import s3fs
+
+from bayesbet.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+_dynamodb_resources = {}
+_dynamodb_tables = {}
+_s3_filesystems = {}
+
+
+def dynamodb_key(region=None, endpoint_url=None):
+    return (
+        region or os.getenv("AWS_REGION"),
+        endpoint_url or os.getenv("AWS_DYNAMODB_ENDPOINT_URL"),
+    )
+
+
+def s3_key(region=None, endpoint_url=None):
+    return (
+        region or os.getenv("AWS_REGION"),
+        endpoint_url or os.getenv("AWS_S3_ENDPOINT_URL"),
+    )
+
+
+def dynamodb_resource(region=None, endpoint_url=None):
+    key = dynamodb_key(region, endpoint_url)
+    if key not in _dynamodb_resources:
+        region, endpoint_url = key
+        _dynamodb_resources[key] = boto3.resource(
+            "dynamodb",
+            region_name=region,
+            endpoint_url=endpoint_url,
+            use_ssl=os.getenv("AWS_USE_SSL"),
+        )
+        logger.info(f"Connected to DynamoDB in region {region} of endpoint {endpoint_url}")
+    return _dynamodb_resources[key]
+
+
+def dynamodb_table(table_name, region=None, endpoint_url=None):
+    key = (table_name, *dynamodb_key(region, endpoint_url))
+    if key not in _dynamodb_tables:
+        _dynamodb_tables[key] = dynamodb_resource(region, endpoint_url).Table(table_name)
+    return _dynamodb_tables[key]
+
+
+def s3_filesystem(region=None, endpoint_url=None):
+    key = s3_key(region, endpoint_url)
+    if key not in _s3_filesystems:
+        region, endpoint_url = key
+        _s3_filesystems[key] = s3fs.S3FileSystem(
+            client_kwargs={
+                "region_name": region,
+                "endpoint_url": endpoint_url,
+                "use_ssl": os.getenv("AWS_USE_SSL"),
+            }
+        )
+    return _s3_filesystems[key]
+
+
+def use_dynamodb_resource(resource, region=None, endpoint_url=None):
+    """Serves resource, and the tables it creates, for region and endpoint_url."""
+    key = dynamodb_key(region, endpoint_url)
+    _dynamodb_resources[key] = resource
+    for table_key in [k for k in _dynamodb_tables if k[1:] == key]:
+        del _dynamodb_tables[table_key]
+
+
+def use_s3_filesystem(filesystem, region=None, endpoint_url=None):
+    """Serves filesystem as the S3 filesystem for region and endpoint_url."""
+    _s3_filesystems[s3_key(region, endpoint_url)] = filesystem
+
+
+def reset():
+    """Drops the cached clients, the next use creates new ones."""
+    _dynamodb_resources.clear()
+    _dynamodb_tables.clear()
+    _s3_filesystems.clear()
@@ -160,42 +160,27 @@ class ModelState(BaseModel):
     variables: ModelVariables
 
     def to_league_state(self) -> LeagueState:
-        teams = {}
-        for i, t in enumerate(self.teams):
-            teams[t] = TeamState(
-                o=(
-                    self.variables.o[0][i],
-                    self.variables.o[1][i],
-                ),
-                d=(
-                    self.variables.d[0][i],
-                    self.variables.d[1][i],
-                ),
-            )
+        o_μ, o_σ = self.variables.o
+        d_μ, d_σ = self.variables.d
         return LeagueState(
             i=self.variables.i,
             h=self.variables.h,
-            teams=teams,
+            teams={
+                t: TeamState(o=team_o, d=team_d)
+                for t, team_o, team_d in zip(self.teams, zip(o_μ, o_σ), zip(d_μ, d_σ))
+            },
         )
     
     def from_league_state(self, league_state: LeagueState):
         self.teams = list(league_state.teams.keys())
-        i = league_state.i
-        h = league_state.h
-        o_μ = []
-        o_σ = []
-        d_μ = []
-        d_σ = []
-        for t in self.teams:
-            o_μ.append(league_state.teams[t].o[0])
-            o_σ.append(league_state.teams[t].o[1])
-            d_μ.append(league_state.teams[t].d[0])
-            d_σ.append(league_state.teams[t].d[1])
+        team_states = league_state.teams.values()
+        o_μ, o_σ = zip(*(team.o for team in team_states))
+        d_μ, d_σ = zip(*(team.d for team in team_states))
         self.variables = ModelVariables(
-            i=i,
-            h=h,
-            o=(o_μ, o_σ),
-            d=(d_μ, d_σ),
+            i=league_state.i,
+            h=league_state.h,
+            o=(list(o_μ), list(o_σ)),
+            d=(list(d_μ), list(d_σ)),
         )
 
 
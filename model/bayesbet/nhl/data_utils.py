@@ -1,5 +1,7 @@
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from bayesbet.logger import get_logger
 
@@ -60,6 +62,49 @@ team_abbrevs = {
 }
 team_names = {v:k for k,v in team_abbrevs.items()}
 
+# Current divisional alignment, used to seed the playoffs
+team_divisions = {
+    'Boston Bruins':'Atlantic',
+    'Buffalo Sabres':'Atlantic',
+    'Detroit Red Wings':'Atlantic',
+    'Florida Panthers':'Atlantic',
+    'Montréal Canadiens':'Atlantic',
+    'Ottawa Senators':'Atlantic',
+    'Tampa Bay Lightning':'Atlantic',
+    'Toronto Maple Leafs':'Atlantic',
+    'Carolina Hurricanes':'Metropolitan',
+    'Columbus Blue Jackets':'Metropolitan',
+    'New Jersey Devils':'Metropolitan',
+    'New York Islanders':'Metropolitan',
+    'New York Rangers':'Metropolitan',
+    'Philadelphia Flyers':'Metropolitan',
+    'Pittsburgh Penguins':'Metropolitan',
+    'Washington Capitals':'Metropolitan',
+    'Chicago Blackhawks':'Central',
+    'Colorado Avalanche':'Central',
+    'Dallas Stars':'Central',
+    'Minnesota Wild':'Central',
+    'Nashville Predators':'Central',
+    'St. Louis Blues':'Central',
+    'Utah Hockey Club':'Central',
+    'Winnipeg Jets':'Central',
+    'Anaheim Ducks':'Pacific',
+    'Calgary Flames':'Pacific',
+    'Edmonton Oilers':'Pacific',
+    'Los Angeles Kings':'Pacific',
+    'San Jose Sharks':'Pacific',
+    'Seattle Kraken':'Pacific',
+    'Vancouver Canucks':'Pacific',
+    'Vegas Golden Knights':'Pacific',
+}
+
+division_conferences = {
+    'Atlantic':'Eastern',
+    'Metropolitan':'Eastern',
+    'Central':'Western',
+    'Pacific':'Western',
+}
+
 
 # Parses the games JSON data and extracts the relevant information
 # into a pandas dataframe
@@ -136,6 +181,42 @@ def extract_game_data(games_json):
     return games, date_metadata
 
 
+# Column types of the game tables extract_game_data produces
+game_schema = pa.schema([
+    ("game_pk", pa.int64()),
+    ("game_date", pa.string()),
+    ("season", pa.int64()),
+    ("game_type", pa.string()),
+    ("game_state", pa.string()),
+    ("home_team", pa.string()),
+    ("home_reg_score", pa.int64()),
+    ("home_fin_score", pa.int64()),
+    ("away_team", pa.string()),
+    ("away_reg_score", pa.int64()),
+    ("away_fin_score", pa.int64()),
+    ("win_type", pa.string()),
+])
+
+
+def write_games(games, file):
+    """Writes a game table to a Parquet path or binary file object."""
+    table = pa.Table.from_pandas(
+        games[game_schema.names], schema=game_schema, preserve_index=False
+    )
+    pq.write_table(table, file)
+
+
+def read_games(file, columns=None):
+    """Reads only the given columns of a game table written by write_games."""
+    return pq.read_table(file, columns=columns).to_pandas()
+
+
+def read_games_csv(file, columns=None):
+    """Reads a game table from CSV with the dtypes of game_schema."""
+    dtypes = game_schema.empty_table().to_pandas().dtypes.to_dict()
+    return pd.read_csv(file, usecols=columns, dtype=dtypes)
+
+
 def infer_home_team_side(home_team_id, plays):
     if "homeTeamDefendingSide" in plays[0]:
         home_team_start_side = plays[0]["homeTeamDefendingSide"]
@@ -1,26 +1,19 @@
 import logging
-import os
 
 import simplejson as json
-import boto3
 from boto3.dynamodb.conditions import Key
 import numpy as np
 
 from bayesbet.logger import get_logger
+from bayesbet.nhl import connections
 
 
 logger = get_logger(__name__)
-region = os.getenv('AWS_REGION')
-endpoint_url = os.getenv('AWS_DYNAMODB_ENDPOINT_URL')
-use_ssl = os.getenv('AWS_USE_SSL')
 
 
 def get_table(table_name):
-    dynamodb = boto3.resource('dynamodb', region_name=region, endpoint_url=endpoint_url, use_ssl=use_ssl)
-    table = dynamodb.Table(table_name)
-    logger.info(f'Connected to table={table_name} in region {region} of endpoint {endpoint_url}')
-
-    return table
+    # Cached for the process, warm invocations skip the client setup
+    return connections.dynamodb_table(table_name)
 
 def most_recent_dynamodb_item(table_name, hash_key, date):
     table = get_table(table_name)
@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+
+from bayesbet.nhl.data_model import LeagueState, ModelState, ModelVariables, TeamState
+
+
+class ModelStateHistory:
+    """
+    A sequence of model states stored as arrays, a date × (h, i) array of
+    league parameters and a date × team × (o, d) array of team parameters,
+    with the normal μ and σ of each. Each state is labelled with the last
+    game date it was fit to, the initial priors with an empty string, so
+    the dates sort in order. Loaded histories are memory mapped, and slicing
+    by date only reads the selected states.
+    """
+    arrays = ("league", "team")
+    league_columns = ("h_μ", "h_σ", "i_μ", "i_σ")
+    team_columns = ("o_μ", "o_σ", "d_μ", "d_σ")
+
+    def __init__(self, dates, teams, league, team):
+        self.dates = np.asarray(dates, dtype=str)
+        self.teams = list(teams)
+        self.league = league
+        self.team = team
+
+    @classmethod
+    def from_model_states(cls, dates, model_states):
+        teams = model_states[0].teams
+        league = np.empty((len(model_states), len(cls.league_columns)))
+        team = np.empty((len(model_states), len(teams), len(cls.team_columns)))
+        for k, state in enumerate(model_states):
+            if state.teams != teams:
+                raise ValueError(f"Model state for {dates[k]} has different teams!")
+            variables = state.variables
+            league[k] = (*variables.h, *variables.i)
+            team[k] = np.column_stack((*variables.o, *variables.d))
+        return cls(dates, teams, league, team)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.arrays:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        meta = {"dates": self.dates.tolist(), "teams": self.teams}
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in cls.arrays
+        }
+        return cls(meta["dates"], meta["teams"], **arrays)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def between(self, start=None, end=None):
+        """The states with dates from start to end inclusive, as views."""
+        lwr = 0 if start is None else np.searchsorted(self.dates, start, side="left")
+        upr = len(self) if end is None else np.searchsorted(self.dates, end, side="right")
+        return ModelStateHistory(
+            self.dates[lwr:upr], self.teams, self.league[lwr:upr], self.team[lwr:upr]
+        )
+
+    def series(self, column, team=None):
+        """One parameter over time, of the league or of one team."""
+        if team is None:
+            return self.league[:, self.league_columns.index(column)]
+        return self.team[:, self.teams.index(team), self.team_columns.index(column)]
+
+    def model_state(self, k=-1) -> ModelState:
+        h_μ, h_σ, i_μ, i_σ = self.league[k].tolist()
+        o_μ, o_σ, d_μ, d_σ = self.team[k].T.tolist()
+        return ModelState(
+            teams=self.teams,
+            variables=ModelVariables(
+                h=(h_μ, h_σ),
+                i=(i_μ, i_σ),
+                o=(o_μ, o_σ),
+                d=(d_μ, d_σ),
+            ),
+        )
+
+    def league_state(self, k=-1) -> LeagueState:
+        h_μ, h_σ, i_μ, i_σ = self.league[k].tolist()
+        return LeagueState(
+            h=(h_μ, h_σ),
+            i=(i_μ, i_σ),
+            teams={
+                t: TeamState(o=(o_μ, o_σ), d=(d_μ, d_σ))
+                for t, (o_μ, o_σ, d_μ, d_σ) in zip(self.teams, self.team[k].tolist())
+            },
+        )
@@ -0,0 +1,174 @@
+"""
+Runs the daily pipeline in one process, in the order of the Step Function:
+ingest_data, update_previous_record, model_inference, predict_games and
+create_record. The stages hand their DataFrames and pydantic records to
+each other in memory, and the S3 intermediates are only written when a
+pipeline bucket is given. DynamoDB is read and written as usual.
+
+    python -m bayesbet.nhl.local_pipeline --web-bucket bayes-bet-web-local
+"""
+import argparse
+from contextlib import contextmanager
+import datetime as dt
+import json
+import time
+
+import pandas as pd
+
+from bayesbet.logger import get_logger
+from bayesbet.nhl import tasks
+from bayesbet.nhl.connections import s3_filesystem
+
+
+logger = get_logger(__name__)
+
+
+class StageTimer:
+    """Wall times of the pipeline stages, summed over repeated runs."""
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            logger.info(f"Stage {name} took {elapsed:.2f}s")
+
+    def summary(self) -> pd.DataFrame:
+        summary = pd.DataFrame(
+            {"stage": list(self.timings), "seconds": list(self.timings.values())}
+        )
+        summary["fraction"] = summary["seconds"] / summary["seconds"].sum()
+        return summary
+
+
+def run_pipeline(
+    web_bucket=None,
+    pipeline_bucket=None,
+    pipeline_name="local",
+    job_id=None,
+    method="nuts",
+    cores=None,
+    warm_start=False,
+    sampler_state=None,
+    timer=None,
+):
+    """
+    Runs the pipeline once for the next game date. Returns the pipeline
+    metadata and the sampler state to warm start the next run with, which
+    is only used with warm_start=True.
+
+    Without a pipeline_bucket the intermediates stay in memory and the
+    sampler state is only carried between runs of this process. Without a
+    web_bucket the records are put into DynamoDB but the front end's list
+    of prediction dates and the matchup matrix are not updated.
+    """
+    timer = timer or StageTimer()
+    job_id = job_id or dt.datetime.now().strftime("local-%Y%m%dT%H%M%S")
+
+    with timer.stage("ingest_data"):
+        ingested = tasks.ingest()
+        if pipeline_bucket is not None:
+            tasks.write_ingested(pipeline_bucket, pipeline_name, job_id, ingested)
+    metadata = ingested["metadata"]
+    last_pred_date = metadata["last_pred_date"]
+    next_game_date = metadata["next_game_date"]
+
+    with timer.stage("update_previous_record"):
+        tasks.update_record(
+            ingested["last_pred"],
+            ingested["last_pred_games"],
+            last_pred_date,
+            metadata["season_start"],
+        )
+
+    # The state machine's NewGamesChoice
+    if next_game_date is None or not (last_pred_date < next_game_date <= metadata["today"]):
+        logger.info(f"No new games to predict after {last_pred_date}")
+        return metadata, sampler_state
+
+    with timer.stage("model_inference"):
+        if warm_start and pipeline_bucket is not None and sampler_state is None:
+            s3 = s3_filesystem()
+            sampler_state_path = f"{pipeline_bucket}/{pipeline_name}/sampler_state.json"
+            if s3.exists(sampler_state_path):
+                with s3.open(sampler_state_path, "r") as f:
+                    sampler_state = json.load(f)
+        fit_kwargs = dict(sampler_state=sampler_state, cores=cores, warm_start=warm_start)
+        try:
+            model = tasks.fit_model(
+                ingested["last_pred_games"],
+                ingested["last_model_record"].state,
+                method=method,
+                **fit_kwargs,
+            )
+        except Exception:
+            # The state machine's fallback to ModelInferenceLaplace
+            logger.exception(f"Model inference with {method} failed, using laplace")
+            model = tasks.fit_model(
+                ingested["last_pred_games"],
+                ingested["last_model_record"].state,
+                method="laplace",
+                **fit_kwargs,
+            )
+        if pipeline_bucket is not None:
+            tasks.write_inference(pipeline_bucket, pipeline_name, job_id, model)
+    updated_model_state = model.priors
+
+    with timer.stage("predict_games"):
+        predictions = tasks.predict_slate(ingested["games_to_predict"], updated_model_state)
+
+    with timer.stage("create_record"):
+        tasks.publish_records(
+            next_game_date, updated_model_state, predictions, bucket_name=web_bucket
+        )
+
+    return metadata, model.sampler_state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--web-bucket", default=None)
+    parser.add_argument("--pipeline-bucket", default=None)
+    parser.add_argument("--pipeline-name", default="local")
+    parser.add_argument("--method", default="nuts")
+    parser.add_argument("--cores", type=int, default=None)
+    parser.add_argument(
+        "--warm-start",
+        action="store_true",
+        help="Start each fit's NUTS adaptation from the previous fit",
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Keep running until the predictions are caught up to today",
+    )
+    args = parser.parse_args()
+
+    timer = StageTimer()
+    sampler_state = None
+    while True:
+        metadata, sampler_state = run_pipeline(
+            web_bucket=args.web_bucket,
+            pipeline_bucket=args.pipeline_bucket,
+            pipeline_name=args.pipeline_name,
+            method=args.method,
+            cores=args.cores,
+            warm_start=args.warm_start,
+            sampler_state=sampler_state,
+            timer=timer,
+        )
+        # The state machine's BackfillChoice
+        next_game_date = metadata["next_game_date"]
+        caught_up = next_game_date is None or next_game_date >= metadata["today"]
+        if not args.backfill or caught_up or next_game_date <= metadata["last_pred_date"]:
+            break
+    print(timer.summary().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
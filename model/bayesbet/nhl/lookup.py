@@ -0,0 +1,226 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from bayesbet.logger import get_logger
+from bayesbet.nhl import quadrature
+from bayesbet.nhl.quadrature import t_before_shootout
+
+
+logger = get_logger(__name__)
+
+
+def _interpolate(table, lower, step, points):
+    """
+    Multilinear interpolation on a regular grid. points has shape (..., d)
+    for a table whose first d axes are the grid axes, any remaining table axes
+    are interpolated as vectors. Points outside the grid are clamped.
+    """
+    lower = np.asarray(lower)
+    step = np.asarray(step)
+    d = len(lower)
+    n = np.array(table.shape[:d])
+    u = (points - lower) / step
+    idx = np.clip(np.floor(u).astype(int), 0, n - 2)
+    frac = np.clip(u - idx, 0.0, 1.0)[..., np.newaxis]
+    # All 2^d cell corners gathered at once, shape (..., d, 2^d)
+    offsets = np.indices((2,) * d).reshape(d, -1)
+    corners = idx[..., np.newaxis] + offsets
+    weights = np.prod(np.where(offsets == 1, frac, 1.0 - frac), axis=-2)
+    values = table[tuple(np.moveaxis(corners, -2, 0))]
+    value_axes = table.ndim - d
+    weights = weights.reshape(weights.shape + (1,) * value_axes)
+    return np.sum(weights * values, axis=-1 - value_axes)
+
+
+class PredictionTable:
+    """
+    Precomputed goal distributions and overtime probabilities over a grid of
+    log scoring rate parameters. The grids are regular in μ and in σ², which
+    keeps the multilinear interpolation error small with few σ grid points.
+    Parameters outside of the grid fall back to the quadrature engine.
+    """
+    arrays = ("score_pdf", "ot_win", "goal_within")
+
+    def __init__(self, score_pdf, ot_win, goal_within, meta):
+        self.score_pdf = score_pdf
+        self.ot_win = ot_win
+        self.goal_within = goal_within
+        self.meta = meta
+
+    @classmethod
+    def build(
+        cls,
+        t=t_before_shootout,
+        max_y=10,
+        μ_range=(-0.5, 2.5),
+        σ_max=0.4,
+        pdf_steps=(0.005, 0.0025),
+        ot_steps=(0.025, 0.04),
+        tol=5e-5,
+        n_check=20000,
+        seed=0,
+    ):
+        """
+        Builds the tables and checks the interpolation error against the exact
+        integrals at n_check random points. Raises a ValueError if the
+        observed error exceeds tol. The check is empirical, the error between
+        the sampled points is not bounded.
+        """
+        var_max = σ_max ** 2
+        pdf_μ = np.arange(μ_range[0], μ_range[1] + pdf_steps[0] / 2, pdf_steps[0])
+        pdf_var = np.arange(0.0, var_max + pdf_steps[1] / 2, pdf_steps[1])
+        ot_μ = np.arange(μ_range[0], μ_range[1] + ot_steps[0] / 2, ot_steps[0])
+        ot_var = np.arange(0.0, var_max + ot_steps[1] / 2, ot_steps[1])
+
+        μ, var = np.meshgrid(pdf_μ, pdf_var, indexing="ij")
+        score_pdf = quadrature.poisson_pdf(μ, np.sqrt(var), max_y=max_y)
+
+        # Built one home μ slice at a time to bound the memory of the nodes
+        μₕ, varₕ, μₐ, varₐ = np.meshgrid(ot_μ, ot_var, ot_μ, ot_var, indexing="ij")
+        ot_win = np.empty(μₕ.shape)
+        goal_within = np.empty(μₕ.shape)
+        for k in range(len(ot_μ)):
+            params = (μₕ[k], np.sqrt(varₕ[k]), μₐ[k], np.sqrt(varₐ[k]))
+            ot_win[k] = quadrature.bernoulli_win_pdf(*params)
+            goal_within[k] = quadrature.goal_within_time(t, *params)
+
+        meta = {
+            "t": t,
+            "max_y": max_y,
+            "mu_range": list(μ_range),
+            "sigma_max": σ_max,
+            "pdf_steps": list(pdf_steps),
+            "ot_steps": list(ot_steps),
+        }
+        table = cls(score_pdf, ot_win, goal_within, meta)
+        validation_error = table.validate(n_check=n_check, seed=seed)
+        table.meta["validation_error"] = validation_error
+        if max(validation_error.values()) > tol:
+            raise ValueError(
+                f"Interpolation error {validation_error} exceeds tolerance {tol}!"
+            )
+        logger.info(f"Built prediction table with validation error {validation_error}")
+        return table
+
+    def validate(self, n_check=20000, seed=0):
+        """
+        The maximum absolute interpolation error of each table against the
+        exact integrals, observed at uniformly sampled points within the grid.
+        """
+        rng = np.random.default_rng(seed)
+        lwr, upr = self.meta["mu_range"]
+        σ_max = self.meta["sigma_max"]
+        μₕ, μₐ = rng.uniform(lwr, upr, size=(2, n_check))
+        σₕ, σₐ = rng.uniform(0.0, σ_max, size=(2, n_check))
+        t = self.meta["t"]
+        max_y = self.meta["max_y"]
+
+        def max_error(approx, exact):
+            return float(np.max(np.abs(approx - exact)))
+
+        return {
+            "score_pdf": max_error(
+                self._interpolate_pdf(μₕ, σₕ),
+                quadrature.poisson_pdf(μₕ, σₕ, max_y=max_y),
+            ),
+            "ot_win": max_error(
+                self._interpolate_ot(self.ot_win, μₕ, σₕ, μₐ, σₐ),
+                quadrature.bernoulli_win_pdf(μₕ, σₕ, μₐ, σₐ),
+            ),
+            "goal_within": max_error(
+                self._interpolate_ot(self.goal_within, μₕ, σₕ, μₐ, σₐ),
+                quadrature.goal_within_time(t, μₕ, σₕ, μₐ, σₐ),
+            ),
+        }
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.arrays:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in cls.arrays
+        }
+        return cls(meta=meta, **arrays)
+
+    def _in_range(self, *params):
+        lwr, upr = self.meta["mu_range"]
+        σ_max = self.meta["sigma_max"]
+        in_range = True
+        for μ, σ in zip(params[::2], params[1::2]):
+            in_range = in_range & (μ >= lwr) & (μ <= upr) & (σ >= 0.0) & (σ <= σ_max)
+        return in_range
+
+    def _interpolate_pdf(self, μ, σ):
+        points = np.stack(np.broadcast_arrays(μ, np.square(σ)), axis=-1)
+        lower = (self.meta["mu_range"][0], 0.0)
+        return _interpolate(self.score_pdf, lower, self.meta["pdf_steps"], points)
+
+    def _interpolate_ot(self, table, μₕ, σₕ, μₐ, σₐ):
+        points = np.stack(
+            np.broadcast_arrays(μₕ, np.square(σₕ), μₐ, np.square(σₐ)), axis=-1
+        )
+        μ_lwr = self.meta["mu_range"][0]
+        μ_step, var_step = self.meta["ot_steps"]
+        lower = (μ_lwr, 0.0, μ_lwr, 0.0)
+        step = (μ_step, var_step, μ_step, var_step)
+        return _interpolate(table, lower, step, points)
+
+    def _with_fallback(self, approx, exact, params):
+        shape = np.broadcast_shapes(*(np.shape(p) for p in params))
+        in_range = np.broadcast_to(self._in_range(*params), shape)
+        if np.all(in_range):
+            return approx
+        outside = ~in_range
+        approx = np.array(approx)
+        approx[outside] = exact(*(np.broadcast_to(p, shape)[outside] for p in params))
+        return approx
+
+    def poisson_pdf(self, μ, σ, max_y=10):
+        if max_y != self.meta["max_y"]:
+            raise ValueError(f"Prediction table was built with max_y={self.meta['max_y']}!")
+        μ = np.asarray(μ, dtype=float)
+        σ = np.asarray(σ, dtype=float)
+        approx = self._interpolate_pdf(μ, σ)
+        return self._with_fallback(
+            approx,
+            lambda μ, σ: quadrature.poisson_pdf(μ, σ, max_y=max_y),
+            (μ, σ),
+        )
+
+    def bernoulli_win_pdf(self, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
+        params = tuple(
+            np.asarray(p, dtype=float)
+            for p in (log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ)
+        )
+        approx = self._interpolate_ot(self.ot_win, *params)
+        return self._with_fallback(approx, quadrature.bernoulli_win_pdf, params)
+
+    def goal_within_time(self, t, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
+        if t != self.meta["t"]:
+            raise ValueError(f"Prediction table was built with t={self.meta['t']}!")
+        params = tuple(
+            np.asarray(p, dtype=float)
+            for p in (log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ)
+        )
+        approx = self._interpolate_ot(self.goal_within, *params)
+        return self._with_fallback(
+            approx,
+            lambda *p: quadrature.goal_within_time(t, *p),
+            params,
+        )
+
+
+if __name__ == "__main__":
+    # Build the prediction table artifact: python -m bayesbet.nhl.lookup <path>
+    PredictionTable.build().save(sys.argv[1])
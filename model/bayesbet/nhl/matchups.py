@@ -0,0 +1,162 @@
+import numpy as np
+
+from bayesbet.nhl.data_model import GamePrediction, ModelState
+from bayesbet.nhl.model import IterativeUpdateModel, game_prediction, game_predictions
+
+
+class MatchupMatrix:
+    """
+    Predictions for every home and away pairing of a model state's teams,
+    computed in one vectorized pass. The goal distributions are
+    (home, away, goals) arrays, and the win probabilities a
+    (variant, home, away, side, outcome) array, with the regular season and
+    playoff variants, the home and away sides and the regulation, overtime
+    and shootout outcomes. A team paired with itself is computed but
+    meaningless. Predictions for any pairing are then lookups.
+    """
+    variants = ("regular", "playoff")
+    sides = ("home", "away")
+    outcomes = ("regulation", "overtime", "shootout")
+
+    def __init__(self, teams, home_score_pdf, away_score_pdf, win_percentages):
+        self.teams = list(teams)
+        self.team_idx = {t: k for k, t in enumerate(self.teams)}
+        self.home_score_pdf = home_score_pdf
+        self.away_score_pdf = away_score_pdf
+        self.win_percentages = win_percentages
+
+    @classmethod
+    def from_model(cls, model: IterativeUpdateModel):
+        teams = model.state.teams
+        home_teams, away_teams = (
+            a.ravel() for a in np.meshgrid(teams, teams, indexing="ij")
+        )
+        shape = (len(teams), len(teams))
+        win_percentages = []
+        for playoff in (False, True):
+            predictions = model.quadrature_predictions(
+                home_teams, away_teams, np.full(len(home_teams), playoff)
+            )
+            win_p = predictions["win_percentages"]
+            win_percentages.append([
+                [np.reshape(win_p[side][outcome], shape) for outcome in cls.outcomes]
+                for side in cls.sides
+            ])
+        score_p = predictions["score_probabilities"]
+        return cls(
+            teams,
+            np.reshape(score_p["home"], shape + (-1,)),
+            np.reshape(score_p["away"], shape + (-1,)),
+            # (variant, side, outcome, home, away) to (variant, home, away, side, outcome)
+            np.moveaxis(np.asarray(win_percentages), (3, 4), (1, 2)),
+        )
+
+    @classmethod
+    def from_model_state(cls, model_state: ModelState, prediction_table=None):
+        model = IterativeUpdateModel(
+            model_state,
+            delta_sigma=0.0,
+            f_thresh=0.0,
+            fattening_factor=1.0,
+            prediction_table=prediction_table,
+        )
+        return cls.from_model(model)
+
+    def save(self, file):
+        """Saves the arrays and teams to a .npz path or binary file object."""
+        np.savez_compressed(
+            file,
+            teams=np.asarray(self.teams, dtype=str),
+            home_score_pdf=self.home_score_pdf,
+            away_score_pdf=self.away_score_pdf,
+            win_percentages=self.win_percentages,
+        )
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as arrays:
+            return cls(
+                arrays["teams"].tolist(),
+                arrays["home_score_pdf"],
+                arrays["away_score_pdf"],
+                arrays["win_percentages"],
+            )
+
+    def lookup(self, home_teams, away_teams, playoff):
+        """
+        Stacked prediction arrays for arrays of home and away team names and
+        playoff flags, in the layout of IterativeUpdateModel.predict_batch.
+        """
+        idₕ = np.array([self.team_idx[t] for t in home_teams], dtype=int)
+        idₐ = np.array([self.team_idx[t] for t in away_teams], dtype=int)
+        variant = np.asarray(playoff, dtype=int)
+        win_p = self.win_percentages[variant, idₕ, idₐ]
+        return {
+            "score_probabilities": {
+                "home": self.home_score_pdf[idₕ, idₐ],
+                "away": self.away_score_pdf[idₕ, idₐ],
+            },
+            "win_percentages": {
+                side: {
+                    outcome: win_p[:, j, k] for k, outcome in enumerate(self.outcomes)
+                }
+                for j, side in enumerate(self.sides)
+            },
+        }
+
+    def predict_batch(self, games, as_arrays=False):
+        """Predictions for every game in the games dataframe."""
+        predictions = self.lookup(
+            games["home_team"].to_numpy(),
+            games["away_team"].to_numpy(),
+            games["game_type"].to_numpy() == "P",
+        )
+        if as_arrays:
+            return predictions
+        return game_predictions(games, predictions)
+
+    def single_game_prediction(self, game) -> GamePrediction:
+        predictions = self.lookup(
+            [game["home_team"]], [game["away_team"]], [game["game_type"] == "P"]
+        )
+        prediction = {
+            "score_probabilities": {
+                side: v[0] for side, v in predictions["score_probabilities"].items()
+            },
+            "win_percentages": {
+                side: {outcome: v[0] for outcome, v in win_p.items()}
+                for side, win_p in predictions["win_percentages"].items()
+            },
+        }
+        return game_prediction(game, prediction)
+
+    def home_win_probability(self, home_team, away_team, playoff=False):
+        """The probability the home team wins in any fashion."""
+        variant = int(playoff)
+        win_p = self.win_percentages[
+            variant, self.team_idx[home_team], self.team_idx[away_team], 0
+        ]
+        return float(win_p.sum())
+
+    def series_odds(self, high_seed, low_seed, wins=4, home_games=(0, 1, 4, 6)):
+        """
+        The probability the high seed wins a playoff series to the given
+        number of wins, hosting the games numbered in home_games and
+        visiting for the rest. The default is the 2-2-1-1-1 best of seven.
+        """
+        p_home = self.home_win_probability(high_seed, low_seed, playoff=True)
+        p_away = 1.0 - self.home_win_probability(low_seed, high_seed, playoff=True)
+        # Probability of each (high seed wins, low seed wins) series score
+        scores = np.zeros((wins + 1, wins + 1))
+        scores[0, 0] = 1.0
+        p_series = 0.0
+        for game in range(2 * wins - 1):
+            p = p_home if game in home_games else p_away
+            played = np.zeros_like(scores)
+            played[1:, :] += scores[:-1, :] * p
+            played[:, 1:] += scores[:, :-1] * (1.0 - p)
+            p_series += played[wins, :wins].sum()
+            played[wins, :] = 0.0
+            played[:, wins] = 0.0
+            scores = played
+        return p_series
@@ -1,303 +1,1068 @@
-from math import factorial, exp, sqrt, pi
+from contextlib import contextmanager
+from functools import lru_cache
+import importlib.util
+import multiprocessing
+import multiprocessing.heap
+import os
+from typing import TYPE_CHECKING
+
 import numpy as np
 import pandas as pd
-import pymc as pm
-from scipy.integrate import quad, dblquad
-from scipy.stats import norm
 
+from bayesbet.logger import get_logger
+from bayesbet.nhl import quadrature
 from bayesbet.nhl.data_model import (
     GamePrediction,
     ModelState,
-    ModelVariables,
 )
+from bayesbet.nhl.quadrature import (
+    overtime_probabilities,
+    t_before_shootout,
+)
+from bayesbet.nhl.state import ModelStateArrays
+
+# PyMC, ArviZ and SciPy are imported where the model is fit, so predictions
+# from a stored state do not pay for importing them
+if TYPE_CHECKING:
+    import pymc as pm
+
+
+logger = get_logger(__name__)
+
+# Compiled NUTS samplers that pm.sample can dispatch to, installed separately
+external_nuts_samplers = ("nutpie", "numpyro", "blackjax")
+
+def available_cores():
+    """The number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+@contextmanager
+def shared_memory_arena():
+    """
+    Allocates multiprocessing shared arrays in the temporary directory while
+    open if /dev/shm is missing, as in AWS Lambda, where the arena would
+    otherwise fail to stat it. The arena's directory candidates are restored
+    on exit, so other multiprocessing users are unaffected.
+    """
+    if os.path.isdir("/dev/shm"):
+        yield
+        return
+    dir_candidates = multiprocessing.heap.Arena._dir_candidates
+    multiprocessing.heap.Arena._dir_candidates = []
+    try:
+        yield
+    finally:
+        multiprocessing.heap.Arena._dir_candidates = dir_candidates
+
+
+@lru_cache(maxsize=None)
+def multiprocessing_context():
+    """
+    The multiprocessing context for sampling chains in parallel, or None if
+    child processes and shared memory are unavailable. PyMC only needs pipes
+    and shared arrays, so fork works in AWS Lambda, which has no /dev/shm for
+    semaphores. Sampling must then run within shared_memory_arena().
+    """
+    try:
+        mp_ctx = multiprocessing.get_context("fork")
+        conn, remote_conn = mp_ctx.Pipe()
+        conn.close()
+        remote_conn.close()
+        with shared_memory_arena():
+            mp_ctx.RawArray("c", 1)
+    except (OSError, ValueError):
+        logger.warning("Multiprocessing is unavailable, chains will not run in parallel")
+        return None
+    return mp_ctx
+
+
+def vectorized_chains_backend():
+    """An installed sampler backend that vectorizes chains in one process."""
+    if importlib.util.find_spec("numpyro") is not None:
+        return "numpyro"
+    return None
+
+
+# Model graphs by team count, with their compiled functions and trace templates.
+# Kept at module level so warm processes and new model instances reuse them.
+_compiled_models = {}
+
+
+def sampling_diagnostics(chain_draws):
+    """
+    Minimum bulk ESS and maximum R-hat over all elements of the variables in
+    chain_draws, whose draws have leading (chain, draw) axes. A single chain
+    is split in half so R-hat can still be computed.
+    """
+    if len(next(iter(chain_draws.values()))) == 1:
+        chain_draws = {
+            v: x[:, :x.shape[1] // 2 * 2].reshape((2, -1) + x.shape[2:])
+            for v, x in chain_draws.items()
+        }
+    import arviz as az
+
+    posterior = az.convert_to_dataset(chain_draws)
+    ess = az.ess(posterior, method="bulk")
+    r_hat = az.rhat(posterior)
+    return {
+        "ess_bulk": min(float(ess[v].min()) for v in ess.data_vars),
+        "r_hat": max(float(r_hat[v].max()) for v in r_hat.data_vars),
+    }
 
 
-t_before_shootout = 5.0/60.0    # 5 minute shootout, divided by regulation time
+class DrawMoments:
+    """
+    pm.sample callback accumulating the mean and variance of the raveled
+    free parameters over the draws after tuning, which the mass matrix
+    adaptation estimates. Welford's updates keep the draws out of memory,
+    so the trace only needs the summarized variables. The last point of
+    each chain is kept to continue sampling from.
+    """
+    def __init__(self, var_names):
+        self.var_names = var_names
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last_points = {}
+
+    def __call__(self, trace, draw):
+        # Parallel draws are views of shared memory that the next draw reuses
+        self.last_points[draw.chain] = {v: np.copy(x) for v, x in draw.point.items()}
+        if draw.tuning:
+            return
+        x = np.concatenate([np.ravel(draw.point[v]) for v in self.var_names])
+        self.n += 1
+        δ = x - self.mean
+        self.mean = self.mean + δ / self.n
+        self.m2 = self.m2 + δ * (x - self.mean)
+
+    @property
+    def var(self):
+        return self.m2 / self.n
+
+
+def adapted_sampler_state(trace, moments):
+    """The tuned step size and the free parameter moments of a NUTS run."""
+    return {
+        "step_size": float(np.mean(trace.get_sampler_stats("step_size"))),
+        "mean": moments.mean.tolist(),
+        "var": moments.var.tolist(),
+    }
+
+
+def nuts_step(model, state=None):
+    """
+    A NUTS step for model whose step size and diagonal mass matrix
+    adaptation start from a sampler_state, or from PyMC's defaults if state
+    is None. The step resets to these values before every chain.
+    """
+    import pymc as pm
+    from pymc.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+
+    if state is None:
+        return pm.NUTS(model=model)
+    n = len(state["mean"])
+    potential = QuadPotentialDiagAdapt(
+        n,
+        pm.floatX(np.asarray(state["mean"])),
+        pm.floatX(np.asarray(state["var"])),
+        50,
+    )
+    # PyMC divides step_scale by n^¼ for the initial step size
+    return pm.NUTS(model=model, step_scale=state["step_size"] * n**0.25, potential=potential)
+
+
+def create_model(n_teams, data) -> "pm.Model":
+    """
+    The model graph, with the priors and observations in mutable data
+    containers initialized from data.
+    """
+    import pymc as pm
+
+    with pm.Model() as model:
+        h_μ = pm.MutableData('h_μ', data['h_μ'])
+        h_σ = pm.MutableData('h_σ', data['h_σ'])
+        i_μ = pm.MutableData('i_μ', data['i_μ'])
+        i_σ = pm.MutableData('i_σ', data['i_σ'])
+        o_μ = pm.MutableData('o_μ', data['o_μ'])
+        o_σ = pm.MutableData('o_σ', data['o_σ'])
+        d_μ = pm.MutableData('d_μ', data['d_μ'])
+        d_σ = pm.MutableData('d_σ', data['d_σ'])
+        Δ_σ = pm.MutableData('Δ_σ', data['Δ_σ'])
+        idₕ = pm.MutableData('idₕ', data['idₕ'])
+        sₕ_obs = pm.MutableData('sₕ_obs', data['sₕ_obs'])
+        idₐ = pm.MutableData('idₐ', data['idₐ'])
+        sₐ_obs = pm.MutableData('sₐ_obs', data['sₐ_obs'])
+        hw_obs = pm.MutableData('hw_obs', data['hw_obs'])
+
+        # Global model parameters
+        h = pm.Normal('h', mu=h_μ, sigma=h_σ)
+        i = pm.Normal('i', mu=i_μ, sigma=i_σ)
+
+        # Team-specific poisson model parameters
+        o_star_init = pm.Normal('o_star_init', mu=o_μ, sigma=o_σ, shape=n_teams)
+        Δ_o = pm.Normal('Δ_o', mu=0.0, sigma=Δ_σ, shape=n_teams)
+        o_star = pm.Deterministic('o_star', o_star_init + Δ_o)
+        o = pm.Deterministic('o', o_star - o_star.mean())
+
+        d_star_init = pm.Normal('d_star_init', mu=d_μ, sigma=d_σ, shape=n_teams)
+        Δ_d = pm.Normal('Δ_d', mu=0.0, sigma=Δ_σ, shape=n_teams)
+        d_star = pm.Deterministic('d_star', d_star_init + Δ_d)
+        d = pm.Deterministic('d', d_star - d_star.mean())
+
+        λₕ = pm.math.exp(i + h + o[idₕ] - d[idₐ])
+        λₐ = pm.math.exp(i + o[idₐ] - d[idₕ])
+
+        # OT/SO home win bernoulli model parameter
+        # P(T < Y), where T ~ a, Y ~ b: a/(a + b)
+        pₕ = λₕ/(λₕ + λₐ)
+
+        # Likelihood of observed data
+        sₕ = pm.Poisson('sₕ', mu=λₕ, observed=sₕ_obs)
+        sₐ = pm.Poisson('sₐ', mu=λₐ, observed=sₐ_obs)
+        hw = pm.Bernoulli('hw', p=pₕ, observed=hw_obs)
+
+    return model
+
         
 class IterativeUpdateModel:
     def __init__(
         self,
-        priors: dict | ModelState,
+        priors: dict | ModelState | ModelStateArrays,
         delta_sigma: float,
         f_thresh: float,
         fattening_factor: float,
+        prediction_table=None,
+        sampler_state=None,
     ):
         self.delta_sigma = delta_sigma
         self.f_thresh = f_thresh
         self.fattening_factor = fattening_factor
-        if isinstance(priors, ModelState):
-            self.priors = priors
+        # Optional lookup.PredictionTable used in place of the quadrature engine
+        self.prediction_table = prediction_table
+        # Draws of h, i, o and d from the most recent fit
+        self.posterior_samples = None
+        # Chains, draws per chain, bulk ESS and R-hat of the most recent fit
+        self.sampling_diagnostics = None
+        # Adapted NUTS step size and mass matrix, used to warm start the next fit
+        self.sampler_state = sampler_state
+        self.priors = priors
+
+    @property
+    def priors(self) -> ModelState:
+        """
+        The priors of the next fit as a ModelState. It is a copy built from
+        the array state on each access, so editing it does not change the
+        model until it is assigned back. Assigning a ModelState, dict or
+        ModelStateArrays replaces the state with a copy of it.
+        """
+        return self.state.to_model_state()
+
+    @priors.setter
+    def priors(self, priors):
+        if isinstance(priors, ModelStateArrays):
+            # The fits update the state in place, keep the caller's intact
+            self.state = priors.copy()
+        elif isinstance(priors, ModelState):
+            self.state = ModelStateArrays.from_model_state(priors)
         else:
-            self.priors = ModelState(**priors)
-        
-    def get_model_posteriors(self, trace) -> ModelState:
-        n_teams = len(self.priors.teams)
+            self.state = ModelStateArrays.from_model_state(ModelState(**priors))
+
+    def get_model_posteriors(self, trace) -> ModelStateArrays:
+        """
+        Normal fits to the draws of h, i, o and d, with the maximum
+        likelihood standard deviation. Each variable is reduced over its draw
+        axis at once, in double precision whatever the trace dtype.
+        """
         posteriors = {}
-        h_μ, h_σ = norm.fit(trace['h'])
-        posteriors['h'] = (h_μ, h_σ)
-        i_μ, i_σ = norm.fit(trace['i'])
-        posteriors['i'] = (i_μ, i_σ)
-        o_μ = []
-        o_σ = []
-        d_μ = []
-        d_σ = []
-        for i in range(n_teams):
-            oᵢ_μ, oᵢ_σ = norm.fit(trace['o'][:,i])
-            o_μ.append(oᵢ_μ)
-            o_σ.append(oᵢ_σ)
-            dᵢ_μ, dᵢ_σ = norm.fit(trace['d'][:,i])
-            d_μ.append(dᵢ_μ)
-            d_σ.append(dᵢ_σ)
-        posteriors['o'] = (o_μ, o_σ)
-        posteriors['d'] = (d_μ, d_σ)
-
-        model_variables = ModelVariables(**posteriors)
-        
-        return ModelState(teams=self.priors.teams, variables=model_variables)
+        for v in ModelStateArrays.variables:
+            draws = np.asarray(trace[v])
+            posteriors[v] = (
+                draws.mean(axis=0, dtype=np.float64),
+                draws.std(axis=0, dtype=np.float64),
+            )
+        return ModelStateArrays.from_variables(self.state.teams, **posteriors)
 
     def fatten_priors(self):
-        h_sigma = np.minimum(
-            self.priors.variables.h[1] * self.fattening_factor, self.f_thresh
-        )
-        self.priors.variables.h = (self.priors.variables.h[0], h_sigma)
-
-        i_sigma = np.minimum(
-            self.priors.variables.i[1] * self.fattening_factor, self.f_thresh
-        )
-        self.priors.variables.i = (self.priors.variables.i[0], i_sigma)
-        
-        o_sigma = np.minimum(
-            np.array(self.priors.variables.o[1]) * self.fattening_factor, self.f_thresh
-        ).tolist()
-        self.priors.variables.o = (self.priors.variables.o[0], o_sigma)
-
-        d_sigma = np.minimum(
-            np.array(self.priors.variables.d[1]) * self.fattening_factor, self.f_thresh
-        ).tolist()
-        self.priors.variables.d = (self.priors.variables.d[0], d_sigma)
+        self.state.fatten(self.fattening_factor, self.f_thresh)
 
     def model_ready_data(self, game_data):
-        teams_to_int = {v: i for i, v in enumerate(self.priors.teams)}
+        idₕ, idₐ = self.team_indices(game_data['home_team'], game_data['away_team'])
         model_data = pd.DataFrame()
-        model_data['idₕ'] = game_data['home_team'].replace(teams_to_int)
-        model_data['sₕ'] = game_data['home_reg_score']
-        model_data['idₐ'] = game_data['away_team'].replace(teams_to_int)
-        model_data['sₐ'] = game_data['away_reg_score']
-        model_data['hw'] = game_data['home_fin_score'] > game_data['away_fin_score']
+        model_data['idₕ'] = idₕ
+        model_data['sₕ'] = game_data['home_reg_score'].to_numpy()
+        model_data['idₐ'] = idₐ
+        model_data['sₐ'] = game_data['away_reg_score'].to_numpy()
+        model_data['hw'] = (
+            game_data['home_fin_score'] > game_data['away_fin_score']
+        ).to_numpy()
 
         return model_data
 
 
-    def model_iteration(self, obs_data, samples=5000, tune=2000, cores=1) -> ModelState:
-        n_teams = len(self.priors.teams)
-        idₕ = obs_data['idₕ'].to_numpy().astype(int)
-        sₕ_obs = obs_data['sₕ'].to_numpy().astype(int)
-        idₐ = obs_data['idₐ'].to_numpy().astype(int)
-        sₐ_obs = obs_data['sₐ'].to_numpy().astype(int)
-        hw_obs = obs_data['hw'].to_numpy()
-        
-        with pm.Model():
-            # Global model parameters
-            h = pm.Normal('h', mu=self.priors.variables.h[0], sigma=self.priors.variables.h[1])
-            i = pm.Normal('i', mu=self.priors.variables.i[0], sigma=self.priors.variables.i[1])
-
-            # Team-specific poisson model parameters
-            o_star_init = pm.Normal(
-                'o_star_init',
-                mu=self.priors.variables.o[0],
-                sigma=self.priors.variables.o[1],
-                shape=n_teams,
-            )
-            Δ_o = pm.Normal('Δ_o', mu=0.0, sigma=self.delta_sigma, shape=n_teams)
-            o_star = pm.Deterministic('o_star', o_star_init + Δ_o)
-            o = pm.Deterministic('o', o_star - o_star.mean())
-                                                
-            d_star_init = pm.Normal(
-                'd_star_init',
-                mu=self.priors.variables.d[0],
-                sigma=self.priors.variables.d[1],
-                shape=n_teams,
-            )
-            Δ_d = pm.Normal('Δ_d', mu=0.0, sigma=self.delta_sigma, shape=n_teams)
-            d_star = pm.Deterministic('d_star', d_star_init + Δ_d)
-            d = pm.Deterministic('d', d_star - d_star.mean())
-            
-            λₕ = pm.math.exp(i + h + o[idₕ] - d[idₐ])
-            λₐ = pm.math.exp(i + o[idₐ] - d[idₕ])
+    def model_data(self, obs_data):
+        """
+        Values of the model's data containers for the current priors and
+        the observed games.
+        """
+        return {
+            "h_μ": self.state.h[0],
+            "h_σ": self.state.h[1],
+            "i_μ": self.state.i[0],
+            "i_σ": self.state.i[1],
+            "o_μ": self.state.o_μ,
+            "o_σ": self.state.o_σ,
+            "d_μ": self.state.d_μ,
+            "d_σ": self.state.d_σ,
+            "Δ_σ": self.delta_sigma,
+            "idₕ": obs_data['idₕ'].to_numpy().astype(int),
+            "sₕ_obs": obs_data['sₕ'].to_numpy().astype(int),
+            "idₐ": obs_data['idₐ'].to_numpy().astype(int),
+            "sₐ_obs": obs_data['sₐ'].to_numpy().astype(int),
+            "hw_obs": obs_data['hw'].to_numpy().astype(int),
+        }
 
-            # OT/SO home win bernoulli model parameter
-            # P(T < Y), where T ~ a, Y ~ b: a/(a + b)
-            pₕ = λₕ/(λₕ + λₐ)
-            
-            # Likelihood of observed data
-            sₕ = pm.Poisson('sₕ', mu=λₕ, observed=sₕ_obs)
-            sₐ = pm.Poisson('sₐ', mu=λₐ, observed=sₐ_obs)
-            hw = pm.Bernoulli('hw', p=pₕ, observed=hw_obs)
-
-            trace = pm.sample(
-                samples,
-                tune=tune,
-                chains=3,
-                cores=cores,
-                progressbar=True,
-                return_inferencedata=False
+    def build_model(self, obs_data) -> "pm.Model":
+        """
+        The model with the current priors and observations swapped into its
+        data containers. The graph is only built once per team count, so
+        later fits reuse its compiled functions.
+        """
+        import pymc as pm
+
+        n_teams = self.state.n_teams
+        data = self.model_data(obs_data)
+        if n_teams not in _compiled_models:
+            _compiled_models[n_teams] = {"model": create_model(n_teams, data)}
+        model = _compiled_models[n_teams]["model"]
+        pm.set_data(data, model=model)
+        return model
+
+    def compiled(self, name, compile_fn):
+        """
+        A compiled function or trace template for the current model graph,
+        created with compile_fn on first use.
+        """
+        compiled = _compiled_models[self.state.n_teams]
+        if name not in compiled:
+            with compiled["model"]:
+                compiled[name] = compile_fn()
+        return compiled[name]
+
+    def model_iteration(
+        self,
+        obs_data,
+        samples=5000,
+        tune=2000,
+        cores=None,
+        method="nuts",
+        max_iterations=50000,
+        tolerance=1e-2,
+        sampler_backend="pymc",
+        chains=3,
+        adaptive=False,
+        block=500,
+        ess_target=400,
+        r_hat_target=1.01,
+        warm_start=False,
+        warm_tune=300,
+        trace_dtype=None,
+    ) -> ModelStateArrays:
+        """
+        Fits the model to the observed data and summarizes the posterior.
+        method="nuts" samples the posterior with NUTS, using PyMC's sampler
+        or the compiled sampler named by sampler_backend. The chains run in
+        parallel on up to cores CPUs, all available CPUs by default. Without
+        multiprocessing they are vectorized in one process by NumPyro if it
+        is installed, or otherwise run one after another. With adaptive=True
+        PyMC's sampler draws blocks of block draws until the bulk ESS and
+        R-hat of h, i, o and d meet ess_target and r_hat_target, and samples
+        is only the ceiling. The achieved ESS, R-hat and draws are
+        kept in sampling_diagnostics. PyMC's sampler leaves its adapted step
+        size and mass matrix in sampler_state, and with warm_start=True the
+        next fit starts its adaptation from them with only warm_tune tuning
+        draws. If that run diverges it is sampled again with full tuning.
+        PyMC's sampler only traces h, i, o and d, and trace_dtype="float32"
+        halves the memory of the kept draws. method="advi" or
+        "fullrank_advi" fits a variational approximation instead, stopping
+        once the parameters change by less than tolerance between checks or
+        after max_iterations, and then draws samples from the approximation.
+        method="laplace" uses a normal approximation at the posterior mode.
+        """
+        import pymc as pm
+
+        model = self.build_model(obs_data)
+        if method == "laplace":
+            posteriors, self.posterior_samples = self.laplace_approximation(
+                model, samples=samples, max_iterations=max_iterations
             )
+            self.sampling_diagnostics = None
+            return posteriors
+        if method == "nuts" and sampler_backend == "pymc":
+            cores = min(chains, cores or available_cores())
+            mp_ctx = multiprocessing_context() if cores > 1 else None
+            if cores > 1 and mp_ctx is None:
+                sampler_backend = vectorized_chains_backend() or sampler_backend
+                cores = 1
+        with model:
+            if method == "nuts" and sampler_backend == "pymc":
+                # A new step per fit, the previous fit's adaptation is only
+                # carried over through sampler_state
+                warm = warm_start and self.warm_start_state(model) is not None
+                chain_draws, sampler_state, n_divergent = self.nuts_sample(
+                    nuts_step(model, self.sampler_state if warm else None),
+                    samples,
+                    tune=warm_tune if warm else tune,
+                    chains=chains,
+                    cores=cores,
+                    mp_ctx=mp_ctx,
+                    adaptive=adaptive,
+                    block=block,
+                    ess_target=ess_target,
+                    r_hat_target=r_hat_target,
+                    trace_dtype=trace_dtype,
+                )
+                if warm and n_divergent > 0:
+                    logger.warning(
+                        f"{n_divergent} divergences after warm started tuning, "
+                        "sampling again with full tuning"
+                    )
+                    chain_draws, sampler_state, n_divergent = self.nuts_sample(
+                        nuts_step(model),
+                        samples,
+                        tune=tune,
+                        chains=chains,
+                        cores=cores,
+                        mp_ctx=mp_ctx,
+                        adaptive=adaptive,
+                        block=block,
+                        ess_target=ess_target,
+                        r_hat_target=r_hat_target,
+                        trace_dtype=trace_dtype,
+                    )
+                self.sampler_state = sampler_state
+                trace = {
+                    v: x.reshape((-1,) + x.shape[2:]) for v, x in chain_draws.items()
+                }
+            elif method == "nuts" and sampler_backend in external_nuts_samplers:
+                # The JAX samplers run the chains vectorized on one CPU device
+                nuts_sampler_kwargs = {}
+                if sampler_backend in ("numpyro", "blackjax"):
+                    nuts_sampler_kwargs["chain_method"] = "vectorized"
+                idata = pm.sample(
+                    samples,
+                    tune=tune,
+                    chains=chains,
+                    nuts_sampler=sampler_backend,
+                    nuts_sampler_kwargs=nuts_sampler_kwargs,
+                    progressbar=False,
+                )
+                trace = posterior_draws(idata, ("h", "i", "o", "d"))
+                chain_draws = {
+                    v: idata.posterior[v].values for v in ("h", "i", "o", "d")
+                }
+            elif method == "nuts":
+                raise ValueError(f"Unknown sampler backend {sampler_backend}!")
+            elif method in ("advi", "fullrank_advi"):
+                convergence = pm.callbacks.CheckParametersConvergence(
+                    tolerance=tolerance, diff="absolute"
+                )
+                approx = pm.fit(
+                    n=max_iterations,
+                    method=method,
+                    callbacks=[convergence],
+                    progressbar=False,
+                )
+                logger.info(f"{method} stopped after {len(approx.hist)} iterations")
+                trace = approx.sample(samples, return_inferencedata=False)
+                chain_draws = None
+            else:
+                raise ValueError(f"Unknown inference method {method}!")
+
+            self.sampling_diagnostics = None
+            if chain_draws is not None:
+                n_chains, n_draws = chain_draws["h"].shape
+                self.sampling_diagnostics = {
+                    "chains": n_chains,
+                    "draws": n_draws,
+                    **sampling_diagnostics(chain_draws),
+                }
+                logger.info(f"Sampling diagnostics: {self.sampling_diagnostics}")
         
             posteriors = self.get_model_posteriors(trace)
+            self.posterior_samples = {
+                v: np.asarray(trace[v]) for v in ("h", "i", "o", "d")
+            }
             
             return posteriors
 
-    def fit(self, games, samples=5000, tune=2000, cores=1):
-        self.fatten_priors()
-        obs_data = self.model_ready_data(games)
-        posteriors = self.model_iteration(
-            obs_data, samples=samples, tune=tune, cores=cores
+    def nuts_sample(
+        self,
+        step,
+        samples,
+        tune,
+        chains,
+        cores,
+        mp_ctx,
+        adaptive=False,
+        block=500,
+        ess_target=400,
+        r_hat_target=1.01,
+        trace_dtype=None,
+    ):
+        """
+        Samples the current model with the NUTS step, tracing only h, i, o
+        and d, cast to trace_dtype if given. With adaptive=True the chains
+        are sampled in blocks of block draws, up to samples draws, until the
+        bulk ESS and R-hat targets are met. Every block after the first
+        continues each chain from its last point without tuning, using the
+        step size and mass matrix adapted in the first block. Returns the
+        draws stacked by chain, the adapted sampler_state and the number of
+        divergences.
+        """
+        import pymc as pm
+
+        model = pm.modelcontext(None)
+        moments = DrawMoments([v.name for v in step.vars])
+        # Each chain's trace is a copy of the compiled trace template
+        trace_template = self.compiled(
+            "trace",
+            lambda: pm.backends.NDArray(vars=[model[v] for v in ("h", "i", "o", "d")]),
         )
-        self.priors = posteriors
-        
-        return posteriors
+        draws = min(block, samples) if adaptive else samples
+        initvals = None
+        traces = []
+        while True:
+            with shared_memory_arena():
+                trace = pm.sample(
+                    draws,
+                    tune=tune,
+                    chains=chains,
+                    cores=cores,
+                    mp_ctx=mp_ctx,
+                    step=step,
+                    initvals=initvals,
+                    trace=trace_template,
+                    callback=moments,
+                    compute_convergence_checks=False,
+                    progressbar=True,
+                    return_inferencedata=False
+                )
+            traces.append(trace)
+            chain_draws = {
+                v: np.concatenate(
+                    [np.stack(t.get_values(v, combine=False)) for t in traces], axis=1
+                )
+                for v in ("h", "i", "o", "d")
+            }
+            n_draws = chain_draws["h"].shape[1]
+            if not adaptive or n_draws >= samples:
+                break
+            diagnostics = sampling_diagnostics(chain_draws)
+            logger.info(f"Sampling diagnostics after {n_draws} draws: {diagnostics}")
+            if diagnostics["ess_bulk"] >= ess_target and diagnostics["r_hat"] <= r_hat_target:
+                break
+            if len(traces) == 1:
+                step = nuts_step(model, adapted_sampler_state(trace, moments))
+            initvals = [moments.last_points[chain] for chain in range(chains)]
+            tune = 0
+            draws = min(block, samples - n_draws)
 
-    def bayesian_poisson_pdf(self, μ, σ, max_y=10):
-        def integrand(x, y, σ, μ):
-            pois = (np.exp(x)**y)*np.exp(-np.exp(x))/factorial(y)
-            norm = np.exp(-0.5*((x-μ)/σ)**2.0)/(σ * sqrt(2.0*pi))
-            return  pois * norm
-
-        lwr = -3.0
-        upr = 5.0
-
-        y = np.arange(0,max_y)
-        p = []
-        for yi in y:
-            I = quad(integrand, lwr, upr, args=(yi,σ,μ))
-            p.append(I[0])
-        p.append(1.0 - sum(p))
-        
-        return p
+        if trace_dtype is not None:
+            chain_draws = {v: x.astype(trace_dtype) for v, x in chain_draws.items()}
+        n_divergent = sum(int(np.sum(t.get_sampler_stats("diverging"))) for t in traces)
+        return chain_draws, adapted_sampler_state(traces[0], moments), n_divergent
 
+    def warm_start_state(self, model):
+        """
+        The sampler_state of the previous fit if it matches the free
+        parameters of model, otherwise None.
+        """
+        from pymc.blocking import DictToArrayBijection
 
-    def bayesian_bernoulli_win_pdf(self, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
-        def dblintegrand(y, x, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
-            normₕ = np.exp(-0.5*((x-log_λₕ_μ)/log_λₕ_σ)**2)/(log_λₕ_σ * sqrt(2*pi))
-            normₐ = np.exp(-0.5*((y-log_λₐ_μ)/log_λₐ_σ)**2)/(log_λₐ_σ * sqrt(2*pi))
-            λₕ = np.exp(x)
-            λₐ = np.exp(y)
-            p_dydx = normₐ*normₕ*λₕ/(λₕ + λₐ)
-            return p_dydx
+        if self.sampler_state is None:
+            return None
+        n_params = DictToArrayBijection.map(model.initial_point()).data.size
+        if len(self.sampler_state["mean"]) != n_params:
+            logger.info("Sampler state does not match the model, tuning from scratch")
+            return None
+        return self.sampler_state
 
-        lwr = -3.0
-        upr = 5.0
+    def laplace_approximation(self, model, samples=5000, max_iterations=50000):
+        """
+        Laplace approximation of the posterior. The mode is found with L-BFGS
+        using the model's compiled gradient, and the covariance is the inverse
+        of the negative log posterior Hessian at the mode. The free variables
+        map linearly onto h, i and the centered o and d, so their means and
+        covariance follow exactly and keep the sum to zero constraint.
+        Returns the ModelStateArrays and draws of h, i, o and d from the
+        approximation.
+        """
+        from pymc.blocking import DictToArrayBijection, RaveledVars
+        from scipy.optimize import minimize
 
-        I = dblquad(dblintegrand, lwr, upr, lwr, upr, args=(log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ))
-        p = I[0]
+        n_teams = self.state.n_teams
+        free_vars = ["h", "i", "o_star_init", "Δ_o", "d_star_init", "Δ_d"]
+        # One compiled logp and gradient function serves the optimizer and the
+        # Hessian, compiling the symbolic Hessian would take far longer
+        logp_dlogp = self.compiled(
+            "logp_dlogp",
+            lambda: model.logp_dlogp_function(grad_vars=[model[v] for v in free_vars]),
+        )
+        logp_dlogp.set_extra_values({})
+        initial_point = model.initial_point()
+        start = DictToArrayBijection.map({v: initial_point[v] for v in free_vars})
 
-        return p
+        def neg_logp_dlogp(x):
+            logp, dlogp = logp_dlogp(RaveledVars(x, start.point_map_info))
+            return -logp, -dlogp
 
+        result = minimize(
+            neg_logp_dlogp,
+            start.data,
+            jac=True,
+            method="L-BFGS-B",
+            options={"maxfun": max_iterations},
+        )
+        if not result.success:
+            logger.warning(f"Laplace approximation mode not converged: {result.message}")
+
+        # Central differences of the exact gradient give the Hessian
+        ε = 1e-5
+        precision = np.empty((len(result.x), len(result.x)))
+        for j in range(len(result.x)):
+            step = np.zeros(len(result.x))
+            step[j] = ε
+            precision[:, j] = (
+                neg_logp_dlogp(result.x + step)[1] - neg_logp_dlogp(result.x - step)[1]
+            ) / (2 * ε)
+        precision = (precision + precision.T) / 2
+        Σ = np.linalg.inv(precision)
+
+        # Linear map from the free variables to (h, i, o, d)
+        centering = np.eye(n_teams) - 1.0 / n_teams
+        A = np.zeros((2 + 2 * n_teams, 2 + 4 * n_teams))
+        A[0, 0] = 1.0
+        A[1, 1] = 1.0
+        o_rows = slice(2, 2 + n_teams)
+        d_rows = slice(2 + n_teams, 2 + 2 * n_teams)
+        for k, rows in ((0, o_rows), (1, d_rows)):
+            star_init = 2 + 2 * k * n_teams
+            A[rows, star_init:star_init + n_teams] = centering
+            A[rows, star_init + n_teams:star_init + 2 * n_teams] = centering
+        μ = A @ result.x
+        Σ = A @ Σ @ A.T
+        σ = np.sqrt(np.diag(Σ))
+
+        model_state = ModelStateArrays(self.state.teams, μ, σ)
+
+        # The centering makes Σ singular, so draw through its eigendecomposition
+        rng = np.random.default_rng()
+        draws = rng.multivariate_normal(μ, Σ, size=samples, method="eigh")
+        posterior_samples = {
+            "h": draws[:, 0],
+            "i": draws[:, 1],
+            "o": draws[:, o_rows],
+            "d": draws[:, d_rows],
+        }
+        return model_state, posterior_samples
+
+    def fit(self, games, samples=5000, tune=2000, cores=None, method="nuts", **kwargs):
+        self.fatten_priors()
+        obs_data = self.model_ready_data(games)
+        self.state = self.model_iteration(
+            obs_data, samples=samples, tune=tune, cores=cores, method=method, **kwargs
+        )
+        return self.priors
+
+    def bayesian_poisson_pdf(self, μ, σ, max_y=10):
+        return self.prediction_engine().poisson_pdf(μ, σ, max_y=max_y).tolist()
+
+
+    def bayesian_bernoulli_win_pdf(self, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
+        return float(
+            self.prediction_engine().bernoulli_win_pdf(
+                log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ
+            )
+        )
 
     def bayesian_goal_within_time(self, t, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
-        def dblintegrand(y, x, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
-            normₕ = np.exp(-0.5*((x-log_λₕ_μ)/log_λₕ_σ)**2)/(log_λₕ_σ * sqrt(2*pi))
-            normₐ = np.exp(-0.5*((y-log_λₐ_μ)/log_λₐ_σ)**2)/(log_λₐ_σ * sqrt(2*pi))
-            λₕ = np.exp(x)
-            λₐ = np.exp(y)
-            p = normₐ*normₕ*(1 - np.exp(-1*(λₕ*t + λₐ*t)))
-            return p
+        return float(
+            self.prediction_engine().goal_within_time(
+                t, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ
+            )
+        )
 
-        lwr = -3.0
-        upr = 5.0
+    def team_indices(self, home_teams, away_teams):
+        return self.state.team_indices(home_teams, away_teams)
 
-        I = dblquad(dblintegrand, lwr, upr, lwr, upr, args=(log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ))
-        p = I[0]
+    def log_rate_params(self, home_teams, away_teams):
+        """
+        Means and standard deviations of the home and away log scoring rates
+        for arrays of home and away team names.
+        """
+        idₕ, idₐ = self.team_indices(home_teams, away_teams)
+        i_μ, i_σ = self.state.i
+        h_μ, h_σ = self.state.h
+        o_μ, o_σ = self.state.o_μ, self.state.o_σ
+        d_μ, d_σ = self.state.d_μ, self.state.d_σ
+        # Normal(μ₁,σ₁²) + Normal(μ₂,σ₂²) = Normal(μ₁ + μ₂, σ₁² + σ₂²)
+        log_λₕ_μ = i_μ + h_μ + o_μ[idₕ] - d_μ[idₐ]
+        log_λₕ_σ = np.sqrt(i_σ ** 2 + h_σ ** 2 + o_σ[idₕ] ** 2 + d_σ[idₐ] ** 2)
+        log_λₐ_μ = i_μ + o_μ[idₐ] - d_μ[idₕ]
+        log_λₐ_σ = np.sqrt(i_σ ** 2 + o_σ[idₐ] ** 2 + d_σ[idₕ] ** 2)
+        return log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ
 
-        return p
+    def prediction_engine(self):
+        """
+        The source of the goal distribution and overtime integrals, either the
+        precomputed prediction table or the quadrature engine.
+        """
+        if self.prediction_table is not None:
+            return self.prediction_table
+        return quadrature
 
     def single_game_prediction(self, game) -> GamePrediction:
-        game_pred = {}
-        game_pred["game_pk"] = game["game_pk"]
-        game_pred["home_team"] = game["home_team"]
-        game_pred["away_team"] = game["away_team"]
-        game_pred["outcome"] = {}
-        if game["game_state"] == "Final":
-            game_pred["outcome"]["home_score"] = game["home_fin_score"]
-            game_pred["outcome"]["away_score"] = game["away_fin_score"]
+        log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ = (
+            float(v[0]) for v in self.log_rate_params(
+                [game["home_team"]], [game["away_team"]]
+            )
+        )
+        engine = self.prediction_engine()
+        home_score_pdf = engine.poisson_pdf(log_λₕ_μ, log_λₕ_σ)
+        away_score_pdf = engine.poisson_pdf(log_λₐ_μ, log_λₐ_σ)
+        home_reg_win_p, away_reg_win_p, tie_p = regulation_win_probabilities(
+            home_score_pdf, away_score_pdf
+        )
+        # The OT/SO probabilities only depend on the game, not the tied score
+        pₕ_ot, p_ot_win, p_so_win = overtime_probabilities(
+            t_before_shootout,
+            log_λₕ_μ,
+            log_λₕ_σ,
+            log_λₐ_μ,
+            log_λₐ_σ,
+            game["game_type"],
+            engine=self.prediction_table,
+        )
+        pₐ_ot = 1.0 - pₕ_ot
+        prediction = {
+            "score_probabilities": {
+                "home": home_score_pdf,
+                "away": away_score_pdf,
+            },
+            "win_percentages": {
+                "home": {
+                    "regulation": home_reg_win_p,
+                    "overtime": pₕ_ot * p_ot_win * tie_p,
+                    "shootout": pₕ_ot * p_so_win * tie_p,
+                },
+                "away": {
+                    "regulation": away_reg_win_p,
+                    "overtime": pₐ_ot * p_ot_win * tie_p,
+                    "shootout": pₐ_ot * p_so_win * tie_p,
+                },
+            },
+        }
+        return game_prediction(game, prediction)
+
+    def predict_batch(self, games, as_arrays=False, method="quadrature", n_samples=None):
+        """
+        Vectorized predictions for every game in the games dataframe. Returns a
+        list of GamePredictions, or with as_arrays=True the stacked NumPy
+        arrays in the same nested layout as a GamePrediction.
+
+        method="quadrature" integrates over the normal posterior summaries in
+        the model state. method="samples" averages over the posterior draws
+        of the most recent fit instead, thinned to n_samples if given, which
+        keeps the parameter correlations the normal summaries discard.
+        """
+        home_teams = games["home_team"].to_numpy()
+        away_teams = games["away_team"].to_numpy()
+        playoff = games["game_type"].to_numpy() == "P"
+        if method == "quadrature":
+            predictions = self.quadrature_predictions(home_teams, away_teams, playoff)
+        elif method == "samples":
+            if self.posterior_samples is None:
+                raise ValueError("No posterior samples, the model has not been fit!")
+            idₕ, idₐ = self.team_indices(home_teams, away_teams)
+            predictions = sample_predictions(
+                self.posterior_samples, idₕ, idₐ, playoff, n_samples=n_samples
+            )
         else:
-            game_pred["outcome"]["home_score"] = "-"
-            game_pred["outcome"]["away_score"] = "-"
-
-        teams_to_int = {v: i for i, v in enumerate(self.priors.teams)}
-        idₕ = teams_to_int[game["home_team"]]
-        idₐ = teams_to_int[game["away_team"]]
-        i_μ = self.priors.variables.i[0]
-        i_σ = self.priors.variables.i[1]
-        h_μ = self.priors.variables.h[0]
-        h_σ = self.priors.variables.h[1]
-        oₕ_μ = self.priors.variables.o[0][idₕ]
-        oₕ_σ = self.priors.variables.o[1][idₕ]
-        oₐ_μ = self.priors.variables.o[0][idₐ]
-        oₐ_σ = self.priors.variables.o[1][idₐ]
-        dₕ_μ = self.priors.variables.d[0][idₕ]
-        dₕ_σ = self.priors.variables.d[1][idₕ]
-        dₐ_μ = self.priors.variables.d[0][idₐ]
-        dₐ_σ = self.priors.variables.d[1][idₐ]
-        # Normal(μ₁,σ₁²) + Normal(μ₂,σ₂²) = Normal(μ₁ + μ₂, σ₁² + σ₂²)
-        log_λₕ_μ = i_μ + h_μ + oₕ_μ - dₐ_μ
-        log_λₕ_σ = np.sqrt(i_σ ** 2 + h_σ ** 2 + oₕ_σ ** 2 + dₐ_σ ** 2)
-        log_λₐ_μ = i_μ + oₐ_μ - dₕ_μ
-        log_λₐ_σ = np.sqrt(i_σ ** 2 + oₐ_σ ** 2 + dₕ_σ ** 2)
-        home_score_pdf = self.bayesian_poisson_pdf(log_λₕ_μ, log_λₕ_σ)
-        away_score_pdf = self.bayesian_poisson_pdf(log_λₐ_μ, log_λₐ_σ)
-        game_pred["score_probabilities"] = {
-            "home": home_score_pdf,
-            "away": away_score_pdf,
+            raise ValueError(f"Unknown prediction method {method}!")
+        if as_arrays:
+            return predictions
+        return game_predictions(games, predictions)
+
+    def quadrature_predictions(self, home_teams, away_teams, playoff):
+        log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ = self.log_rate_params(
+            home_teams, away_teams
+        )
+        engine = self.prediction_engine()
+        home_score_pdf = engine.poisson_pdf(log_λₕ_μ, log_λₕ_σ)
+        away_score_pdf = engine.poisson_pdf(log_λₐ_μ, log_λₐ_σ)
+        home_reg_win_p, away_reg_win_p, tie_p = regulation_win_probabilities(
+            home_score_pdf, away_score_pdf
+        )
+        pₕ_ot = engine.bernoulli_win_pdf(log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ)
+        pₐ_ot = 1.0 - pₕ_ot
+        # Playoff overtime continues until a goal is scored, no shootouts
+        p_ot_win = np.where(
+            ~playoff,
+            engine.goal_within_time(
+                t_before_shootout, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ
+            ),
+            1.0,
+        )
+        p_so_win = 1.0 - p_ot_win
+        return {
+            "score_probabilities": {
+                "home": home_score_pdf,
+                "away": away_score_pdf,
+            },
+            "win_percentages": {
+                "home": {
+                    "regulation": home_reg_win_p,
+                    "overtime": pₕ_ot * p_ot_win * tie_p,
+                    "shootout": pₕ_ot * p_so_win * tie_p,
+                },
+                "away": {
+                    "regulation": away_reg_win_p,
+                    "overtime": pₐ_ot * p_ot_win * tie_p,
+                    "shootout": pₐ_ot * p_so_win * tie_p,
+                },
+            },
         }
-        home_reg_win_p = 0.0
-        home_ot_win_p = 0.0
-        home_so_win_p = 0.0
-        away_reg_win_p = 0.0
-        away_ot_win_p = 0.0
-        away_so_win_p = 0.0
-        for sₕ, pₕ in enumerate(home_score_pdf):
-            for sₐ, pₐ in enumerate(away_score_pdf):
-                p = pₕ * pₐ
-                if sₕ > sₐ:
-                    home_reg_win_p += p
-                elif sₐ > sₕ:
-                    away_reg_win_p += p
-                else:
-                    if game["game_type"] != "P":
-                        p_ot_win = self.bayesian_goal_within_time(
-                            t_before_shootout, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ
-                        )
-                        p_so_win = 1.0 - p_ot_win
-                    else:
-                        p_ot_win = 1.0
-                        p_so_win = 0.0
-                    pₕ_ot = self.bayesian_bernoulli_win_pdf(
-                        log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ
-                    )
-                    pₐ_ot = 1.0 - pₕ_ot
-                    home_ot_win_p += pₕ_ot * p_ot_win * p
-                    home_so_win_p += pₕ_ot * p_so_win * p
-                    away_ot_win_p += pₐ_ot * p_ot_win * p
-                    away_so_win_p += pₐ_ot * p_so_win * p
-        win_percentages = {
+
+    def predict(self, games):
+        return self.predict_batch(games)
+
+
+class AssumedDensityFilterModel(IterativeUpdateModel):
+    """
+    Assumed density filter over the same model as IterativeUpdateModel. Each
+    game is a moment matching update of the independent normal marginals of
+    h, i, o and d, with the game likelihood integrated over the two log
+    scoring rates by Gauss-Hermite quadrature. No sampling is needed, so long
+    histories replay in seconds for experiments and hyperparameter searches.
+    """
+    # Rows of the home and away log scoring rates over (i, h, oₕ, dₐ, oₐ, dₕ)
+    rate_design = np.array([
+        [1.0, 1.0, 1.0, -1.0, 0.0, 0.0],
+        [1.0, 0.0, 0.0, 0.0, 1.0, -1.0],
+    ])
+
+    def fit(self, games, order=20, **kwargs):
+        """
+        Updates the priors with one day of games, in the same way as
+        IterativeUpdateModel.fit. Sampler arguments are accepted and ignored
+        so the engines are interchangeable.
+        """
+        self.fatten_priors()
+        n_teams = self.state.n_teams
+        μ = self.state.μ.copy()
+        var = np.square(self.state.σ)
+        # The daily Δ_o and Δ_d innovations
+        var[2:] += self.delta_sigma ** 2
+
+        idₕ, idₐ = self.team_indices(games["home_team"], games["away_team"])
+        sₕ_obs = games["home_reg_score"].to_numpy().astype(int)
+        sₐ_obs = games["away_reg_score"].to_numpy().astype(int)
+        hw_obs = (games["home_fin_score"] > games["away_fin_score"]).to_numpy()
+        for k in range(len(games)):
+            idx = np.array([1, 0, 2 + idₕ[k], 2 + n_teams + idₐ[k], 2 + idₐ[k], 2 + n_teams + idₕ[k]])
+            μ[idx], var[idx] = self.game_update(
+                μ[idx], var[idx], sₕ_obs[k], sₐ_obs[k], hw_obs[k], order
+            )
+
+        # Center o and d like the deterministic o = o_star - mean(o_star)
+        for team_vars in (slice(2, 2 + n_teams), slice(2 + n_teams, None)):
+            μ[team_vars] -= μ[team_vars].mean()
+            var[team_vars] = var[team_vars] * (1 - 2 / n_teams) + var[team_vars].sum() / n_teams ** 2
+        self.state = ModelStateArrays(self.state.teams, μ, np.sqrt(var))
+        self.posterior_samples = None
+        self.sampling_diagnostics = None
+
+        return self.priors
+
+    def game_update(self, μ, var, sₕ, sₐ, hw, order=20):
+        """
+        Moment matched posterior of (i, h, oₕ, dₐ, oₐ, dₕ) after one game.
+        The likelihood only depends on the two log scoring rates, so their
+        posterior moments are integrated in 2-D and propagated back to the
+        parameters through the linear Gaussian relationship.
+        """
+        X = self.rate_design
+        m = X @ μ
+        S = (X * var) @ X.T
+        x, w = quadrature.normal_nodes(0.0, 1.0, order)
+        z = np.stack([np.repeat(x, order), np.tile(x, order)])
+        w = np.outer(w, w).ravel()
+        η = m[:, np.newaxis] + np.linalg.cholesky(S) @ z
+
+        # Poisson scores and the Bernoulli home win, log σ(x) = -log(1 + e⁻ˣ)
+        log_lik = sₕ * η[0] - np.exp(η[0]) + sₐ * η[1] - np.exp(η[1])
+        log_lik -= np.logaddexp(0.0, (η[1] - η[0]) if hw else (η[0] - η[1]))
+        p = w * np.exp(log_lik - log_lik.max())
+        p /= p.sum()
+        m_post = η @ p
+        r = η - m_post[:, np.newaxis]
+        S_post = (r * p) @ r.T
+
+        K = (var[:, np.newaxis] * X.T) @ np.linalg.inv(S)
+        μ = μ + K @ (m_post - m)
+        var = var - np.einsum("ij,jk,ik->i", K, S - S_post, K)
+        return μ, var
+
+
+# Model engines by name, for selecting the engine from experiment parameters
+model_engines = {
+    "iterative": IterativeUpdateModel,
+    "adf": AssumedDensityFilterModel,
+}
+
+
+def posterior_draws(idata, var_names):
+    """
+    Posterior draws from InferenceData with the chains concatenated, in the
+    same layout as indexing a MultiTrace.
+    """
+    draws = {}
+    for v in var_names:
+        values = idata.posterior[v].values
+        draws[v] = values.reshape((-1,) + values.shape[2:])
+    return draws
+
+
+def regulation_win_probabilities(home_score_pdf, away_score_pdf):
+    """
+    Home regulation win, away regulation win and tied after regulation
+    probabilities from independent goal distributions. Accepts stacked
+    (..., n_goals) arrays.
+    """
+    # P(other team scored strictly fewer goals) for each goal count
+    def fewer_goals(score_pdf):
+        cdf = np.cumsum(score_pdf, axis=-1)
+        return np.concatenate(
+            (np.zeros(cdf.shape[:-1] + (1,)), cdf[..., :-1]), axis=-1
+        )
+
+    home_reg_win_p = np.sum(home_score_pdf * fewer_goals(away_score_pdf), axis=-1)
+    away_reg_win_p = np.sum(away_score_pdf * fewer_goals(home_score_pdf), axis=-1)
+    tie_p = np.sum(home_score_pdf * away_score_pdf, axis=-1)
+    return home_reg_win_p, away_reg_win_p, tie_p
+
+
+def sample_predictions(samples, idₕ, idₐ, playoff, n_samples=None, max_y=10):
+    """
+    Prediction arrays averaged over posterior draws of h, i, o and d. Each
+    draw fixes the scoring rates, so the goal distributions and OT/SO
+    probabilities are exact per draw and no quadrature is needed. The joint
+    score distribution is averaged per draw, so shared parameters keep the
+    home and away scores correlated. Computed over draws × games × goals.
+    """
+    n_draws = len(samples["h"])
+    if n_samples is not None and n_samples < n_draws:
+        draws = np.linspace(0, n_draws - 1, n_samples).astype(int)
+    else:
+        draws = slice(None)
+    h = samples["h"][draws, np.newaxis]
+    i = samples["i"][draws, np.newaxis]
+    o = samples["o"][draws]
+    d = samples["d"][draws]
+    log_λₕ = i + h + o[:, idₕ] - d[:, idₐ]
+    log_λₐ = i + o[:, idₐ] - d[:, idₕ]
+
+    def score_pdf(log_λ):
+        y = np.arange(max_y)
+        log_p = (
+            y * log_λ[..., np.newaxis]
+            - np.exp(log_λ)[..., np.newaxis]
+            - quadrature.log_factorials(max_y)
+        )
+        p = np.exp(log_p)
+        tail = 1.0 - p.sum(axis=-1, keepdims=True)
+        return np.concatenate((p, tail), axis=-1)
+
+    home_draw_pdf = score_pdf(log_λₕ)
+    away_draw_pdf = score_pdf(log_λₐ)
+    home_reg_win_p, away_reg_win_p, tie_p = regulation_win_probabilities(
+        home_draw_pdf, away_draw_pdf
+    )
+    # λₕ/(λₕ + λₐ) written as a logistic function of the log rates
+    pₕ_ot = 1.0 / (1.0 + np.exp(log_λₐ - log_λₕ))
+    pₐ_ot = 1.0 - pₕ_ot
+    p_ot_win = np.where(
+        ~playoff,
+        -np.expm1(-(np.exp(log_λₕ) + np.exp(log_λₐ)) * t_before_shootout),
+        1.0,
+    )
+    p_so_win = 1.0 - p_ot_win
+    return {
+        "score_probabilities": {
+            "home": home_draw_pdf.mean(axis=0),
+            "away": away_draw_pdf.mean(axis=0),
+        },
+        "win_percentages": {
             "home": {
-                "regulation": home_reg_win_p,
-                "overtime": home_ot_win_p,
-                "shootout": home_so_win_p,
+                "regulation": home_reg_win_p.mean(axis=0),
+                "overtime": (pₕ_ot * p_ot_win * tie_p).mean(axis=0),
+                "shootout": (pₕ_ot * p_so_win * tie_p).mean(axis=0),
             },
             "away": {
-                "regulation": away_reg_win_p,
-                "overtime": away_ot_win_p,
-                "shootout": away_so_win_p,
-            }
-        }
-        game_pred["win_percentages"] = win_percentages
-        return GamePrediction(**game_pred)
+                "regulation": away_reg_win_p.mean(axis=0),
+                "overtime": (pₐ_ot * p_ot_win * tie_p).mean(axis=0),
+                "shootout": (pₐ_ot * p_so_win * tie_p).mean(axis=0),
+            },
+        },
+    }
 
-    def predict(self, games):
-        game_predictions_list = []
-        for _, game in games.iterrows():
-            game_pred = self.single_game_prediction(game)
-            game_predictions_list.append(game_pred)
-        return game_predictions_list
+
+def game_prediction(game, prediction) -> GamePrediction:
+    """
+    Materialize a GamePrediction from a game row and its prediction arrays.
+    """
+    game_pred = {}
+    game_pred["game_pk"] = game["game_pk"]
+    game_pred["home_team"] = game["home_team"]
+    game_pred["away_team"] = game["away_team"]
+    game_pred["outcome"] = {}
+    if game["game_state"] == "Final":
+        game_pred["outcome"]["home_score"] = game["home_fin_score"]
+        game_pred["outcome"]["away_score"] = game["away_fin_score"]
+    else:
+        game_pred["outcome"]["home_score"] = "-"
+        game_pred["outcome"]["away_score"] = "-"
+    game_pred["score_probabilities"] = {
+        k: np.asarray(v).tolist()
+        for k, v in prediction["score_probabilities"].items()
+    }
+    game_pred["win_percentages"] = {
+        team: {k: float(v) for k, v in win_p.items()}
+        for team, win_p in prediction["win_percentages"].items()
+    }
+    return GamePrediction(**game_pred)
+
+
+def game_predictions(games, predictions) -> list[GamePrediction]:
+    """
+    Materialize GamePredictions from stacked prediction arrays, one per row
+    of the games dataframe.
+    """
+    game_predictions_list = []
+    for k, game in enumerate(games.to_dict(orient="records")):
+        prediction = {
+            "score_probabilities": {
+                team: v[k] for team, v in predictions["score_probabilities"].items()
+            },
+            "win_percentages": {
+                team: {outcome: v[k] for outcome, v in win_p.items()}
+                for team, win_p in predictions["win_percentages"].items()
+            },
+        }
+        game_predictions_list.append(game_prediction(game, prediction))
+    return game_predictions_list
@@ -0,0 +1,106 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+t_before_shootout = 5.0/60.0    # 5 minute shootout, divided by regulation time
+
+# Fixed order Gauss-Hermite rule. The integrands are smooth in the log rate, so
+# a modest order reproduces the adaptive scipy integrals to well below 1e-6.
+gh_order = 32
+gh_nodes, gh_weights = np.polynomial.hermite.hermgauss(gh_order)
+
+
+def normal_nodes(μ, σ, order=gh_order):
+    """
+    Gauss-Hermite nodes and weights for X ~ Normal(μ, σ²), such that
+    E[f(X)] ≈ sum(w * f(x)). μ and σ may be scalars or broadcastable arrays,
+    the quadrature nodes are added as a trailing axis.
+    """
+    if order == gh_order:
+        t, w = gh_nodes, gh_weights
+    else:
+        t, w = np.polynomial.hermite.hermgauss(order)
+    μ = np.asarray(μ, dtype=float)[..., np.newaxis]
+    σ = np.asarray(σ, dtype=float)[..., np.newaxis]
+    x = μ + np.sqrt(2.0) * σ * t
+    w = w / np.sqrt(np.pi)
+    return x, w
+
+
+def log_factorials(max_y):
+    return np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, max_y)))))
+
+
+def poisson_pdf(μ, σ, max_y=10, order=gh_order):
+    """
+    Goal probabilities for Y ~ Poisson(exp(X)), X ~ Normal(μ, σ²). Returns an
+    array with a trailing axis of length max_y + 1 holding P(Y = 0..max_y-1),
+    with the final entry being the remaining probability P(Y >= max_y).
+    """
+    x, w = normal_nodes(μ, σ, order)
+    y = np.arange(max_y)
+    x = x[..., np.newaxis, :]
+    log_p = y[:, np.newaxis] * x - np.exp(x) - log_factorials(max_y)[:, np.newaxis]
+    p = np.sum(np.exp(log_p) * w, axis=-1)
+    tail = 1.0 - p.sum(axis=-1, keepdims=True)
+    return np.concatenate((p, tail), axis=-1)
+
+
+def normal_nodes_2d(μₕ, σₕ, μₐ, σₐ, order=gh_order):
+    """
+    Tensor product Gauss-Hermite rule for independent Xₕ ~ Normal(μₕ, σₕ²) and
+    Xₐ ~ Normal(μₐ, σₐ²). The nodes occupy two trailing axes.
+    """
+    xₕ, wₕ = normal_nodes(μₕ, σₕ, order)
+    xₐ, wₐ = normal_nodes(μₐ, σₐ, order)
+    xₕ = xₕ[..., :, np.newaxis]
+    xₐ = xₐ[..., np.newaxis, :]
+    w = wₕ[:, np.newaxis] * wₐ[np.newaxis, :]
+    return xₕ, xₐ, w
+
+
+def bernoulli_win_pdf(log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ, order=gh_order):
+    """
+    Probability that the home team scores the next goal, E[λₕ/(λₕ + λₐ)].
+    """
+    xₕ, xₐ, w = normal_nodes_2d(log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ, order)
+    # λₕ/(λₕ + λₐ) written as a logistic function of the log rates
+    p = 1.0 / (1.0 + np.exp(xₐ - xₕ))
+    return np.sum(p * w, axis=(-2, -1))
+
+
+def goal_within_time(t, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ, order=gh_order):
+    """
+    Probability that either team scores within time t (as a fraction of
+    regulation time), E[1 - exp(-(λₕ + λₐ)t)].
+    """
+    xₕ, xₐ, w = normal_nodes_2d(log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ, order)
+    p = -np.expm1(-(np.exp(xₕ) + np.exp(xₐ)) * t)
+    return np.sum(p * w, axis=(-2, -1))
+
+
+@lru_cache(maxsize=4096)
+def overtime_probabilities(
+    t, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ, game_type, engine=None
+):
+    """
+    Memoized overtime and shootout probabilities for a single game, given the
+    game is tied at the end of regulation. Returns a tuple of
+    (home win probability, overtime decision probability, shootout probability).
+    Playoff games have no shootout, overtime continues until a goal is scored.
+    engine is an object with bernoulli_win_pdf and goal_within_time methods,
+    such as a lookup.PredictionTable, in place of the quadrature integrals.
+    """
+    bernoulli = engine.bernoulli_win_pdf if engine is not None else bernoulli_win_pdf
+    within_time = engine.goal_within_time if engine is not None else goal_within_time
+    pₕ_ot = float(bernoulli(log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ))
+    if game_type != "P":
+        p_ot_win = float(
+            within_time(t, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ)
+        )
+        p_so_win = 1.0 - p_ot_win
+    else:
+        p_ot_win = 1.0
+        p_so_win = 0.0
+    return pₕ_ot, p_ot_win, p_so_win
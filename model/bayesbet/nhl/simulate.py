@@ -0,0 +1,250 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bayesbet.logger import get_logger
+from bayesbet.nhl.data_model import ModelState
+from bayesbet.nhl.data_utils import division_conferences, team_divisions
+from bayesbet.nhl.model import (
+    IterativeUpdateModel,
+    available_cores,
+    multiprocessing_context,
+)
+from bayesbet.nhl.state import ModelStateArrays
+
+
+logger = get_logger(__name__)
+
+# Playoff seeds of each conference, the top three of each division and
+# then the two best remaining teams
+playoff_seeds = ("D1", "D2", "D3", "WC1", "WC2")
+
+
+class SeasonSimulation:
+    """
+    Simulated final regular season standings, the points and playoff seed
+    of every team in every simulation. Seeds index into playoff_seeds, with
+    -1 for teams that miss the playoffs.
+    """
+    def __init__(self, teams, points, seeds):
+        self.teams = teams
+        self.points = points
+        self.seeds = seeds
+
+    def points_distribution(self) -> pd.DataFrame:
+        """The probability of each final points total, by team."""
+        max_points = int(self.points.max())
+        counts = np.stack([
+            np.bincount(self.points[:, k], minlength=max_points + 1)
+            for k in range(len(self.teams))
+        ], axis=1)
+        return pd.DataFrame(counts / len(self.points), columns=self.teams)
+
+    def summary(self, quantiles=(0.1, 0.5, 0.9)) -> pd.DataFrame:
+        """Points, playoff odds and seed probabilities by team."""
+        summary = pd.DataFrame({
+            "team": self.teams,
+            "division": [team_divisions.get(t) for t in self.teams],
+            "conference": [
+                division_conferences.get(team_divisions.get(t)) for t in self.teams
+            ],
+            "mean_points": self.points.mean(axis=0),
+        })
+        for q, points in zip(quantiles, np.quantile(self.points, quantiles, axis=0)):
+            summary[f"points_q{round(q * 100)}"] = points
+        summary["playoff_odds"] = (self.seeds >= 0).mean(axis=0)
+        for k, seed in enumerate(playoff_seeds):
+            summary[seed] = (self.seeds == k).mean(axis=0)
+        return summary.sort_values("mean_points", ascending=False, ignore_index=True)
+
+
+def season_schedule(model_state, games, prediction_table=None):
+    """
+    The standings from the completed regular season games, and the teams
+    and outcome probabilities of the remaining ones. Completed games award
+    two points for a win and one for an overtime or shootout loss.
+    """
+    teams = model_state.teams
+    team_idx = {t: k for k, t in enumerate(teams)}
+    games = games[
+        (games["game_type"] == "R")
+        & games["home_team"].isin(teams)
+        & games["away_team"].isin(teams)
+    ]
+    completed = games[games["game_state"] == "Final"]
+    remaining = games[games["game_state"] != "Final"].reset_index(drop=True)
+
+    home_win = (completed["home_fin_score"] > completed["away_fin_score"]).to_numpy()
+    regulation = (completed["home_reg_score"] != completed["away_reg_score"]).to_numpy()
+    idₕ = completed["home_team"].map(team_idx).to_numpy()
+    idₐ = completed["away_team"].map(team_idx).to_numpy()
+    points, regulation_wins = standings(
+        len(teams), idₕ, idₐ, home_win[np.newaxis], regulation[np.newaxis]
+    )
+
+    # Outcome probabilities of each remaining game from the model state
+    model = IterativeUpdateModel(
+        model_state,
+        delta_sigma=0.0,
+        f_thresh=0.0,
+        fattening_factor=1.0,
+        prediction_table=prediction_table,
+    )
+    win_p = model.predict_batch(remaining, as_arrays=True)["win_percentages"]
+    outcome_p = np.column_stack((
+        win_p["home"]["regulation"],
+        win_p["away"]["regulation"],
+        win_p["home"]["overtime"] + win_p["home"]["shootout"],
+        win_p["away"]["overtime"] + win_p["away"]["shootout"],
+    ))
+    return {
+        "points": points[0],
+        "regulation_wins": regulation_wins[0],
+        "idₕ": remaining["home_team"].map(team_idx).to_numpy(),
+        "idₐ": remaining["away_team"].map(team_idx).to_numpy(),
+        "outcome_p": outcome_p / outcome_p.sum(axis=1, keepdims=True),
+    }
+
+
+def standings(n_teams, idₕ, idₐ, home_win, regulation):
+    """
+    Points and regulation wins by team from (simulations, games) arrays of
+    game outcomes, summed over the games with one-hot matrix products.
+    """
+    home = np.zeros((len(idₕ), n_teams), dtype=np.float32)
+    home[np.arange(len(idₕ)), idₕ] = 1.0
+    away = np.zeros((len(idₐ), n_teams), dtype=np.float32)
+    away[np.arange(len(idₐ)), idₐ] = 1.0
+    loser_points = np.where(regulation, 0.0, 1.0).astype(np.float32)
+    home_points = np.where(home_win, 2.0, loser_points).astype(np.float32)
+    away_points = np.where(home_win, loser_points, 2.0).astype(np.float32)
+    points = home_points @ home + away_points @ away
+    regulation_wins = (
+        (home_win & regulation).astype(np.float32) @ home
+        + (~home_win & regulation).astype(np.float32) @ away
+    )
+    return np.rint(points).astype(np.int16), np.rint(regulation_wins).astype(np.int16)
+
+
+def playoff_seeding(teams, points, regulation_wins, rng):
+    """
+    Playoff seeds from (simulations, teams) arrays of final standings. Teams
+    are ranked by points, then regulation wins, then at random.
+    """
+    rank_key = points * 1000.0 + regulation_wins + rng.random(points.shape)
+    seeds = np.full(points.shape, -1, dtype=np.int8)
+    rows = np.arange(len(points))[:, np.newaxis]
+    divisions = np.array([team_divisions.get(t) for t in teams])
+    for division in division_conferences:
+        idx = np.flatnonzero(divisions == division)
+        order = np.argsort(-rank_key[:, idx], axis=1)[:, :3]
+        seeds[rows, idx[order]] = np.arange(3)
+    for conference in set(division_conferences.values()):
+        idx = np.flatnonzero([division_conferences.get(d) == conference for d in divisions])
+        remaining_key = np.where(seeds[:, idx] < 0, rank_key[:, idx], -np.inf)
+        order = np.argsort(-remaining_key, axis=1)[:, :2]
+        seeds[rows, idx[order]] = np.arange(3, 5)
+    return seeds
+
+
+def simulate_outcomes(schedule, n_simulations, rng, rating_samples=None):
+    """
+    Home wins and regulation results of the remaining games, as
+    (simulations, games) arrays. Without rating_samples every game is drawn
+    independently from its predicted outcome probabilities. With them, each
+    simulation plays the season with one draw of the team parameters, and
+    the scores are drawn from the Poisson rates. Tied games go to the home
+    team in overtime or the shootout with probability λₕ/(λₕ + λₐ), as in the
+    model.
+    """
+    idₕ, idₐ = schedule["idₕ"], schedule["idₐ"]
+    if rating_samples is None:
+        u = rng.random((n_simulations, len(idₕ)))
+        p = np.cumsum(schedule["outcome_p"], axis=1)
+        regulation = u < p[:, 1]
+        home_win = (u < p[:, 0]) | ((u >= p[:, 1]) & (u < p[:, 2]))
+        return home_win, regulation
+
+    h, i, o, d = rating_samples
+    log_λₕ = (i + h)[:, np.newaxis] + o[:, idₕ] - d[:, idₐ]
+    log_λₐ = i[:, np.newaxis] + o[:, idₐ] - d[:, idₕ]
+    λₕ = np.exp(log_λₕ)
+    λₐ = np.exp(log_λₐ)
+    sₕ = rng.poisson(λₕ)
+    sₐ = rng.poisson(λₐ)
+    regulation = sₕ != sₐ
+    home_win = (sₕ > sₐ) | (~regulation & (rng.random(sₕ.shape) * (λₕ + λₐ) < λₕ))
+    return home_win, regulation
+
+
+def sample_ratings(model_state, n_simulations, rng):
+    """One draw of h, i, o and d from their normal summaries per simulation."""
+    state = ModelStateArrays.from_model_state(model_state)
+    h = rng.normal(*state.h, size=n_simulations)
+    i = rng.normal(*state.i, size=n_simulations)
+    o = rng.normal(state.o_μ, state.o_σ, size=(n_simulations, state.n_teams))
+    d = rng.normal(state.d_μ, state.d_σ, size=(n_simulations, state.n_teams))
+    return h, i, o, d
+
+
+def simulate_chunk(model_state, schedule, n_simulations, seed, rating_uncertainty):
+    rng = np.random.default_rng(seed)
+    rating_samples = None
+    if rating_uncertainty:
+        rating_samples = sample_ratings(model_state, n_simulations, rng)
+    home_win, regulation = simulate_outcomes(schedule, n_simulations, rng, rating_samples)
+    points, regulation_wins = standings(
+        len(model_state.teams), schedule["idₕ"], schedule["idₐ"], home_win, regulation
+    )
+    points += schedule["points"]
+    regulation_wins += schedule["regulation_wins"]
+    seeds = playoff_seeding(model_state.teams, points, regulation_wins, rng)
+    return points, seeds
+
+
+def simulate_season(
+    model_state: ModelState,
+    games,
+    n_simulations=10000,
+    rating_uncertainty=False,
+    cores=1,
+    seed=None,
+    chunk_size=2000,
+    prediction_table=None,
+) -> SeasonSimulation:
+    """
+    Simulates the rest of the regular season from the games dataframe of
+    extract_game_data, holding every game of the season. The remaining games
+    are drawn from the model state's predictions, or with
+    rating_uncertainty=True from one draw of the team parameters per
+    simulation, which keeps the games of a simulated season correlated.
+    Simulations run in chunks of chunk_size, in parallel on up to cores
+    CPUs, all available CPUs if cores is None.
+    """
+    schedule = season_schedule(model_state, games, prediction_table=prediction_table)
+    chunks = [
+        min(chunk_size, n_simulations - start)
+        for start in range(0, n_simulations, chunk_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    cores = min(len(chunks), cores or available_cores())
+    mp_ctx = multiprocessing_context() if cores > 1 else None
+    args = (
+        [model_state] * len(chunks),
+        [schedule] * len(chunks),
+        chunks,
+        seeds,
+        [rating_uncertainty] * len(chunks),
+    )
+    if mp_ctx is None:
+        results = list(map(simulate_chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=cores, mp_context=mp_ctx) as executor:
+            results = list(executor.map(simulate_chunk, *args))
+    logger.info(f"Simulated {n_simulations} seasons of {len(schedule['idₕ'])} remaining games")
+    return SeasonSimulation(
+        model_state.teams,
+        np.concatenate([points for points, _ in results]),
+        np.concatenate([seeds for _, seeds in results]),
+    )
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from bayesbet.nhl.data_model import LeagueState, ModelState, ModelVariables, TeamState
+
+
+class ModelStateArrays:
+    """
+    The normal summaries of h, i, o and d held in two contiguous float64
+    vectors, μ and σ, laid out as (h, i, o for each team, d for each team),
+    the same order as the laplace and assumed density filter updates. The
+    named attributes are views into them, so the model math reads and
+    updates the state in place. The pydantic ModelState and LeagueState are
+    only built at the I/O boundaries.
+    """
+    variables = ("h", "i", "o", "d")
+
+    def __init__(self, teams, μ, σ):
+        self.teams = list(teams)
+        self.team_index = pd.Index(self.teams)
+        self.μ = np.ascontiguousarray(μ, dtype=np.float64)
+        self.σ = np.ascontiguousarray(σ, dtype=np.float64)
+        n_teams = len(self.teams)
+        if self.μ.shape != (2 + 2 * n_teams,) or self.σ.shape != self.μ.shape:
+            raise ValueError(
+                f"Expected μ and σ of length {2 + 2 * n_teams} for {n_teams} teams!"
+            )
+        self.slices = {
+            "h": slice(0, 1),
+            "i": slice(1, 2),
+            "o": slice(2, 2 + n_teams),
+            "d": slice(2 + n_teams, 2 + 2 * n_teams),
+        }
+
+    @classmethod
+    def from_variables(cls, teams, h, i, o, d):
+        """From (μ, σ) pairs of each variable, scalars for h and i."""
+        μ = np.concatenate([np.atleast_1d(np.asarray(v[0], dtype=np.float64)) for v in (h, i, o, d)])
+        σ = np.concatenate([np.atleast_1d(np.asarray(v[1], dtype=np.float64)) for v in (h, i, o, d)])
+        return cls(teams, μ, σ)
+
+    @classmethod
+    def from_model_state(cls, model_state: ModelState):
+        variables = model_state.variables
+        return cls.from_variables(
+            model_state.teams, variables.h, variables.i, variables.o, variables.d
+        )
+
+    @classmethod
+    def from_league_state(cls, league_state: LeagueState):
+        teams = list(league_state.teams.keys())
+        team_params = np.array(
+            [(*league_state.teams[t].o, *league_state.teams[t].d) for t in teams],
+            dtype=np.float64,
+        ).reshape(len(teams), 4)
+        return cls.from_variables(
+            teams,
+            league_state.h,
+            league_state.i,
+            (team_params[:, 0], team_params[:, 1]),
+            (team_params[:, 2], team_params[:, 3]),
+        )
+
+    def to_model_state(self) -> ModelState:
+        return ModelState(
+            teams=self.teams,
+            variables=ModelVariables(
+                h=self.h,
+                i=self.i,
+                o=(self.o_μ.tolist(), self.o_σ.tolist()),
+                d=(self.d_μ.tolist(), self.d_σ.tolist()),
+            ),
+        )
+
+    def to_league_state(self) -> LeagueState:
+        team_params = np.column_stack((self.o_μ, self.o_σ, self.d_μ, self.d_σ)).tolist()
+        return LeagueState(
+            h=self.h,
+            i=self.i,
+            teams={
+                t: TeamState(o=(o_μ, o_σ), d=(d_μ, d_σ))
+                for t, (o_μ, o_σ, d_μ, d_σ) in zip(self.teams, team_params)
+            },
+        )
+
+    def copy(self):
+        return ModelStateArrays(self.teams, self.μ.copy(), self.σ.copy())
+
+    @property
+    def n_teams(self):
+        return len(self.teams)
+
+    @property
+    def h(self):
+        return (float(self.μ[0]), float(self.σ[0]))
+
+    @property
+    def i(self):
+        return (float(self.μ[1]), float(self.σ[1]))
+
+    @property
+    def o_μ(self):
+        return self.μ[self.slices["o"]]
+
+    @property
+    def o_σ(self):
+        return self.σ[self.slices["o"]]
+
+    @property
+    def d_μ(self):
+        return self.μ[self.slices["d"]]
+
+    @property
+    def d_σ(self):
+        return self.σ[self.slices["d"]]
+
+    def fatten(self, fattening_factor, f_thresh):
+        """Widens every σ by fattening_factor, capped at f_thresh, in place."""
+        np.minimum(self.σ * fattening_factor, f_thresh, out=self.σ)
+
+    def team_indices(self, home_teams, away_teams):
+        idₕ = self.team_index.get_indexer(home_teams)
+        idₐ = self.team_index.get_indexer(away_teams)
+        if (idₕ < 0).any() or (idₐ < 0).any():
+            unknown = set(np.asarray(home_teams)[idₕ < 0])
+            unknown |= set(np.asarray(away_teams)[idₐ < 0])
+            raise KeyError(f"Teams {sorted(unknown)} are not in the model state!")
+        return idₕ, idₐ
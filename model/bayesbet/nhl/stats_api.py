@@ -1,10 +1,15 @@
+import hashlib
 import logging
 import os
+import tempfile
+import time
 
 import datetime as dt
 import simplejson as json
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bayesbet.logger import get_logger
 
 
@@ -14,28 +19,133 @@ logger = get_logger(__name__)
 base_url = 'https://api-web.nhle.com'
 stats_url = 'https://api.nhle.com/stats/rest/en'
 
+# (connect, read) timeouts in seconds, so a stalled response fails the
+# request instead of hanging the Lambda until it times out
+timeout = (3.05, 30)
+# Retries of failed connections and throttled or failed responses, waiting
+# 0.5, 1, 2, 4 and 8 seconds or as long as a Retry-After header asks
+retry = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET",),
+    raise_on_status=False,
+)
+# The on-disk response cache, /tmp is the only writable path in Lambda and
+# persists across warm invocations. An empty STATS_API_CACHE_DIR disables it.
+cache_dir = os.getenv(
+    "STATS_API_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bayesbet_stats_api")
+)
+season_list_max_age = 24 * 60 * 60  # Seconds before the season list is revalidated
+
+_session = None
+
+
+def get_session():
+    """
+    The shared session, pooling the connections to both API hosts across
+    requests and warm invocations.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(max_retries=retry)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def cache_path(url):
+    return os.path.join(cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def read_cache(url):
+    if not cache_dir:
+        return None
+    try:
+        with open(cache_path(url), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(url, entry):
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written to a temporary file and renamed, so readers never see a partial entry
+    path = cache_path(url)
+    with open(path + ".tmp", "w") as f:
+        json.dump(entry, f)
+    os.replace(path + ".tmp", path)
+
+
+def get_json(url, immutable=False, max_age=None):
+    """
+    The JSON body of a GET request through the shared session and cache.
+    A cached response is returned without a request if it was stored as
+    immutable, or is younger than max_age seconds. Otherwise it is
+    revalidated with its ETag or Last-Modified, and reused on a 304. The
+    immutable argument is a bool or a function of the response body, for
+    responses that are only final in some states.
+    """
+    entry = read_cache(url)
+    if entry is not None and (
+        entry["immutable"]
+        or (max_age is not None and time.time() - entry["fetched"] < max_age)
+    ):
+        return entry["body"]
+
+    headers = {}
+    if entry is not None and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    response = get_session().get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and entry is not None:
+        entry["fetched"] = time.time()
+        write_cache(url, entry)
+        return entry["body"]
+    response.raise_for_status()
+
+    body = response.json()
+    if callable(immutable):
+        immutable = immutable(body)
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if immutable or etag or last_modified or max_age is not None:
+        write_cache(url, {
+            "url": url,
+            "fetched": time.time(),
+            "immutable": bool(immutable),
+            "etag": etag,
+            "last_modified": last_modified,
+            "body": body,
+        })
+    return body
+
+
+def game_final(game_json):
+    """If the game is official, its play-by-play no longer changes."""
+    return game_json.get("gameState") == "OFF"
+
 
 # Retrieves the JSON game data from the NHL stats API for a 
 # selected date range.
 def request_games_json(date):
     path = '/v1/score/'+date
-    response = requests.get(base_url + path)
-    
-    return response.json()
+    return get_json(base_url + path)
 
 # Retrieves the play-by-play data from the NHL stats API for a given game id
 def request_play_by_play_json(game_id):
     path = f'/v1/gamecenter/{game_id}/play-by-play'
-    response = requests.get(base_url + path)
-    
-    return response.json()
+    return get_json(base_url + path, immutable=game_final)
 
-# Retrieves the shift data from the NHL stats API for a given game id
-def request_shifts_json(game_id):
+# Retrieves the shift data from the NHL stats API for a given game id, the
+# shifts of a final game are cached for good
+def request_shifts_json(game_id, final=False):
     path = f"/shiftcharts?cayenneExp=gameId={game_id} and (duration != '00:00' and typeCode = 517)"
-    response = requests.get(stats_url + path)
-    
-    return response.json()    
+    return get_json(stats_url + path, immutable=final)
 
 ## Check if any games have been played on the specified date
 def check_for_games(date=None):
@@ -61,8 +171,11 @@ def get_season_start_date(season):
     Finds the regular season start date of the requested season.
     """
     path = '/v1/standings-season/'
-    response = requests.get(base_url + path)
-    seasons_json = response.json()
+    seasons_json = get_json(base_url + path, max_age=season_list_max_age)
     seasons = {s["id"]:s["standingsStart"] for s in seasons_json["seasons"]}
+    if season not in seasons:
+        # A new season may have been added since the list was cached
+        seasons_json = get_json(base_url + path, max_age=0)
+        seasons = {s["id"]:s["standingsStart"] for s in seasons_json["seasons"]}
 
     return seasons[season]
@@ -2,18 +2,27 @@ import simplejson as json
 import os
 import pandas as pd
 import datetime as dt
-import s3fs
 
 from bayesbet.logger import get_logger
+from bayesbet.nhl import codec
+from bayesbet.nhl.connections import s3_filesystem
 from bayesbet.nhl.data_model import (
     PredictionRecord,
     ModelStateRecord,
     GamePrediction,
     PredictionPerformance,
 )
-from bayesbet.nhl.data_utils import extract_game_data, team_abbrevs
+from bayesbet.nhl.data_utils import (
+    extract_game_data,
+    read_games,
+    read_games_csv,
+    team_abbrevs,
+    write_games,
+)
 from bayesbet.nhl.db import query_dynamodb, put_dynamodb_item, most_recent_dynamodb_item
 from bayesbet.nhl.evaluate import update_scores, prediction_performance
+from bayesbet.nhl.lookup import PredictionTable
+from bayesbet.nhl.matchups import MatchupMatrix
 from bayesbet.nhl.model import IterativeUpdateModel, ModelState
 from bayesbet.nhl.stats_api import (
     request_games_json,
@@ -30,6 +39,17 @@ f_thresh = 0.075  # A cap on team variable standard deviation to prevent blowup
 window_size = 1  # The number previous game days used in each iteration
 delta_sigma = 0.001  # The standard deviaton of the random walk variables
 perf_ws = 14  # Window size for model performance stats
+prediction_table_path = os.getenv("PREDICTION_TABLE_PATH")
+# The game columns the later stages read back from the ingested games
+inference_columns = [
+    "home_team",
+    "away_team",
+    "home_reg_score",
+    "away_reg_score",
+    "home_fin_score",
+    "away_fin_score",
+]
+update_columns = ["game_pk", "game_state", "home_fin_score", "away_fin_score"]
 metadata = {
     "framework": framework,
     "model_version": model_version,
@@ -39,6 +59,22 @@ metadata = {
 }
 
 
+_prediction_table = None
+
+
+def get_prediction_table():
+    """
+    Loads the optional precomputed prediction table once per container.
+    """
+    global _prediction_table
+    if _prediction_table is None and prediction_table_path:
+        if os.path.exists(os.path.join(prediction_table_path, "meta.json")):
+            _prediction_table = PredictionTable.load(prediction_table_path)
+        else:
+            logger.info(f"No prediction table found at {prediction_table_path}")
+    return _prediction_table
+
+
 def fetch_nhl_data_by_date(date):
     """ 
     Retrieves data from the NHL stats API and loads it into a dataframe.
@@ -55,18 +91,41 @@ def fetch_nhl_data_by_date(date):
     return game_data, date_metadata
 
 
+def read_ingested_games(s3, prefix, name, columns=None):
+    """
+    Reads the columns of a game table saved by write_ingested, or the CSV
+    saved by the ingest of runs started before the Parquet intermediates.
+    """
+    if s3.exists(f"{prefix}/{name}.parquet"):
+        with s3.open(f"{prefix}/{name}.parquet", "rb") as f:
+            return read_games(f, columns=columns)
+    with s3.open(f"{prefix}/{name}.csv", "rb") as f:
+        return read_games_csv(f, columns=columns)
+
+
 def create_record(
     bucket_name,
     game_date,
     updated_model_state,
     game_preds,
 ):
+    model_state = ModelState.model_validate(updated_model_state)
+    predictions = [GamePrediction.model_validate(pred) for pred in game_preds]
+    publish_records(game_date, model_state, predictions, bucket_name=bucket_name)
+    return
+
+
+def publish_records(game_date, model_state, predictions, bucket_name=None):
+    """
+    Puts the model state and prediction records for game_date into
+    DynamoDB. With a web bucket_name, the matchup matrix is written and
+    game_date is added to the prediction dates the front end lists.
+    """
     pred_table_name = os.getenv('DYNAMODB_PRED_TABLE_NAME')
     model_table_name = os.getenv('DYNAMODB_MODEL_TABLE_NAME')
     deployment_version = os.getenv('DEPLOYMENT_VERSION')
 
     # Update Model State
-    model_state = ModelState.model_validate(updated_model_state)
     model_state_record = ModelStateRecord(
         league="nhl",
         prediction_date=game_date,
@@ -76,7 +135,6 @@ def create_record(
     logger.info(f"Generated new model state record for League=nhl and date={game_date}")
 
     # Update Prediction Record
-    predictions = [GamePrediction.model_validate(pred) for pred in game_preds]
     prediction_record = PredictionRecord(
         league="nhl",
         prediction_date=game_date,
@@ -88,15 +146,19 @@ def create_record(
     put_dynamodb_item(pred_table_name, prediction_record.model_dump())
     logger.info(f"Generated new prediction record for League=nhl and date={game_date}")
 
-    # Get the pred_dates from s3 and update
-    endpoint_url = os.getenv("AWS_S3_ENDPOINT_URL")
-    use_ssl = os.getenv("AWS_USE_SSL")
-    s3 = s3fs.S3FileSystem(
-        client_kwargs={
-            "endpoint_url": endpoint_url,
-            "use_ssl": use_ssl,
-        }
+    if bucket_name is None:
+        return
+
+    # Predictions for every pairing of teams, for matchups not on the schedule
+    s3 = s3_filesystem()
+    matchups = MatchupMatrix.from_model_state(
+        model_state, prediction_table=get_prediction_table()
     )
+    with s3.open(f"{bucket_name}/matchups/{game_date}.npz", "wb") as f:
+        matchups.save(f)
+    logger.info(f"Generated new matchup matrix for League=nhl and date={game_date}")
+
+    # Get the pred_dates from s3 and update
     with s3.open(f"{bucket_name}/pred_dates.json", "rb") as f:
         pred_dates = json.load(f)
         pred_dates = pred_dates + [game_date]
@@ -104,22 +166,40 @@ def create_record(
     with s3.open(f"{bucket_name}/pred_dates.json", "w") as f:
         json.dump(pred_dates, f)
 
-    return
-
 
 def ingest_data(bucket_name, pipeline_name, job_id):
+    ingested = ingest()
+    write_ingested(bucket_name, pipeline_name, job_id, ingested)
+    return {
+        **ingested["metadata"],
+        "games_to_predict": ingested["games_to_predict"].to_dict(orient="records"),
+    }
+
+
+def write_ingested(bucket_name, pipeline_name, job_id, ingested):
+    """Saves the ingested records and games for the later pipeline stages."""
+    s3 = s3_filesystem()
+    prefix = f"{bucket_name}/{pipeline_name}/{job_id}"
+    # Validated once by ingest, the later stages load them as trusted records
+    with s3.open(f"{prefix}/lastpred.json", "wb") as f:
+        f.write(codec.dumps(ingested["last_pred"]))
+    with s3.open(f"{prefix}/last_model_record.json", "wb") as f:
+        f.write(codec.dumps(ingested["last_model_record"]))
+    with s3.open(f"{prefix}/last_pred_games.parquet", "wb") as f:
+        write_games(ingested["last_pred_games"], f)
+    with s3.open(f"{prefix}/games.parquet", "wb") as f:
+        write_games(ingested["games"], f)
+
+
+def ingest():
+    """
+    The most recent prediction and model state records, the games of the
+    last prediction date and of the next date with NHL games, and the
+    pipeline metadata the state machine branches on.
+    """
     today_dt = dt.date.today()
     today = today_dt.strftime("%Y-%m-%d")
 
-    endpoint_url = os.getenv("AWS_S3_ENDPOINT_URL")
-    use_ssl = os.getenv("AWS_USE_SSL")
-    s3 = s3fs.S3FileSystem(
-        client_kwargs={
-            "endpoint_url": endpoint_url,
-            "use_ssl": use_ssl,
-        }
-    )
-
     pred_table_name = os.getenv('DYNAMODB_PRED_TABLE_NAME')
     model_table_name = os.getenv('DYNAMODB_MODEL_TABLE_NAME')
     
@@ -128,10 +208,6 @@ def ingest_data(bucket_name, pipeline_name, job_id):
     last_model_state = most_recent_dynamodb_item(model_table_name, 'nhl', today)
     last_pred_date = last_pred['prediction_date']
     logger.info(f'Most recent prediction is from {last_pred_date}')
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/lastpred.json", "w") as f:
-        json.dump(last_pred, f)
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/last_model_record.json", "w") as f:
-        json.dump(last_model_state, f)
 
     teams = sorted(list(team_abbrevs.keys()))
 
@@ -177,27 +253,25 @@ def ingest_data(bucket_name, pipeline_name, job_id):
     current_pred_season = season_metadata["current_pred_season"]
     season_start = season_metadata["season_start"]
 
-    # Save games to S3
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/last_pred_games.csv", "wb") as f:
-        last_pred_games.to_csv(f, index=False)
-
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/games.csv", "wb") as f:
-        games.to_csv(f, index=False)    
-
     # Get the games that need to be predicted
     pred_idx = (games["game_date"] == next_game_date) & (
         games["game_state"] != "Postponed"
     )
-    games_to_predict = games[pred_idx]
-    games_to_predict = games_to_predict.to_dict(orient="records")
+    games_to_predict = games[pred_idx].reset_index(drop=True)
 
     return {
-        "current_season": int(current_pred_season),
-        "last_pred_date": last_pred_date,
-        "next_game_date": next_game_date,
-        "today": today,
+        "last_pred": PredictionRecord.model_validate(last_pred),
+        "last_model_record": ModelStateRecord.model_validate(last_model_state),
+        "last_pred_games": last_pred_games,
+        "games": games,
         "games_to_predict": games_to_predict,
-        "season_start": season_start,
+        "metadata": {
+            "current_season": int(current_pred_season),
+            "last_pred_date": last_pred_date,
+            "next_game_date": next_game_date,
+            "today": today,
+            "season_start": season_start,
+        },
     }
 
 
@@ -205,29 +279,70 @@ def model_inference(
     bucket_name,
     pipeline_name,
     job_id,
+    method="nuts",
+    sampler_backend="pymc",
+    chains=3,
+    cores=None,
+    adaptive=False,
+    warm_start=False,
 ):
-    # Get the games CSV from s3
-    endpoint_url = os.getenv("AWS_S3_ENDPOINT_URL")
-    use_ssl = os.getenv("AWS_USE_SSL")
-    s3 = s3fs.S3FileSystem(
-        client_kwargs={
-            "endpoint_url": endpoint_url,
-            "use_ssl": use_ssl,
-        }
+    # Get the games from s3
+    s3 = s3_filesystem()
+    games = read_ingested_games(
+        s3, f"{bucket_name}/{pipeline_name}/{job_id}", "last_pred_games", inference_columns
     )
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/last_pred_games.csv", "rb") as f:
-        games = pd.read_csv(f)
 
     # Get the last record JSON from S3
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/last_model_record.json", "r") as f:
-        last_model_state_record = ModelStateRecord.model_validate_json(f.read())
+    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/last_model_record.json", "rb") as f:
+        last_model_state_record = codec.loads(ModelStateRecord, f.read(), trusted=True)
         last_model_state = last_model_state_record.state
 
-    model = IterativeUpdateModel(
+    # The sampler adaptation of the previous run warm starts this one
+    sampler_state = None
+    sampler_state_path = f"{bucket_name}/{pipeline_name}/sampler_state.json"
+    if warm_start and s3.exists(sampler_state_path):
+        with s3.open(sampler_state_path, "r") as f:
+            sampler_state = json.load(f)
+
+    model = fit_model(
+        games,
         last_model_state,
+        sampler_state=sampler_state,
+        method=method,
+        sampler_backend=sampler_backend,
+        chains=chains,
+        cores=cores,
+        adaptive=adaptive,
+        warm_start=warm_start,
+    )
+    updated_model_state = model.priors
+    write_inference(bucket_name, pipeline_name, job_id, model)
+
+    return updated_model_state.model_dump()
+
+
+def fit_model(
+    games,
+    model_state,
+    sampler_state=None,
+    method="nuts",
+    sampler_backend="pymc",
+    chains=3,
+    cores=None,
+    adaptive=False,
+    warm_start=False,
+) -> IterativeUpdateModel:
+    """
+    Updates the model state with the games of the last prediction date.
+    Returns the fitted model, holding the updated state, the sampling
+    diagnostics and the sampler state that warm starts the next fit.
+    """
+    model = IterativeUpdateModel(
+        model_state,
         delta_sigma=delta_sigma,
         f_thresh=f_thresh,
-        fattening_factor=fattening_factor
+        fattening_factor=fattening_factor,
+        sampler_state=sampler_state,
     )
 
     # Filter to only games that have teams the model knows about
@@ -238,14 +353,35 @@ def model_inference(
         )
     ].reset_index(drop=True)
 
-    # Get games from the most recent game date played
-    updated_model_state = model.fit(games, cores=1)
+    # Get games from the most recent game date played, cores=None spreads
+    # the chains over the available vCPUs
+    model.fit(
+        games,
+        cores=cores,
+        chains=chains,
+        method=method,
+        sampler_backend=sampler_backend,
+        adaptive=adaptive,
+        warm_start=warm_start,
+    )
+    return model
+
+
+def write_inference(bucket_name, pipeline_name, job_id, model):
+    """Saves the updated model state, diagnostics and sampler state."""
+    s3 = s3_filesystem()
 
     # Update the model state in S3 for later reference if necessary
     with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/updated_model_state.json", "w") as f:
-        f.write(updated_model_state.model_dump_json())
+        f.write(model.priors.model_dump_json())
 
-    return updated_model_state.model_dump()
+    # Keep the achieved ESS, R-hat and draws alongside the model state
+    if model.sampling_diagnostics is not None:
+        with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/sampling_diagnostics.json", "w") as f:
+            f.write(json.dumps(model.sampling_diagnostics))
+    if model.sampler_state is not None:
+        with s3.open(f"{bucket_name}/{pipeline_name}/sampler_state.json", "w") as f:
+            f.write(json.dumps(model.sampler_state))
 
 
 def predict_game(game, updated_model_state):
@@ -254,34 +390,70 @@ def predict_game(game, updated_model_state):
         model_state,
         delta_sigma=delta_sigma,
         f_thresh=f_thresh,
-        fattening_factor=fattening_factor
+        fattening_factor=fattening_factor,
+        prediction_table=get_prediction_table(),
     )
     prediction = model.single_game_prediction(game)
     return prediction.model_dump()
 
 
+def predict_games(games, updated_model_state, chunk_size=None):
+    """
+    Predicts a whole slate of games in one invocation, in place of one
+    predict_game invocation per game.
+    """
+    model_state = ModelState.model_validate(updated_model_state)
+    predictions = predict_slate(pd.DataFrame(games), model_state, chunk_size=chunk_size)
+    return [prediction.model_dump() for prediction in predictions]
+
+
+def predict_slate(games, model_state, chunk_size=None) -> list[GamePrediction]:
+    """
+    Vectorized predictions for every game in the games dataframe, the whole
+    slate in one batch by default. chunk_size limits the games per batch,
+    which bounds the intermediate arrays but not the task's payload.
+    """
+    if len(games) == 0:
+        return []
+    model = IterativeUpdateModel(
+        model_state,
+        delta_sigma=delta_sigma,
+        f_thresh=f_thresh,
+        fattening_factor=fattening_factor,
+        prediction_table=get_prediction_table(),
+    )
+    chunk_size = chunk_size or len(games)
+    predictions = []
+    for start in range(0, len(games), chunk_size):
+        predictions += model.predict_batch(games.iloc[start:start + chunk_size])
+    logger.info(f"Predicted {len(predictions)} games")
+    return predictions
+
+
 def update_previous_record(
     bucket_name, pipeline_name, job_id, last_pred_date, season_start
 ):
-    # Get the games CSV from s3
-    endpoint_url = os.getenv("AWS_S3_ENDPOINT_URL")
-    use_ssl = os.getenv("AWS_USE_SSL")
-    s3 = s3fs.S3FileSystem(
-        client_kwargs={
-            "endpoint_url": endpoint_url,
-            "use_ssl": use_ssl,
-        }
+    # Get the games from s3
+    s3 = s3_filesystem()
+    games = read_ingested_games(
+        s3, f"{bucket_name}/{pipeline_name}/{job_id}", "last_pred_games", update_columns
     )
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/last_pred_games.csv", "rb") as f:
-        games = pd.read_csv(f)
 
     # Get the last record JSON from S3
-    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/lastpred.json", "r") as f:
-        last_pred = PredictionRecord.model_validate_json(f.read())
+    with s3.open(f"{bucket_name}/{pipeline_name}/{job_id}/lastpred.json", "rb") as f:
+        last_pred = codec.loads(PredictionRecord, f.read(), trusted=True)
+
+    update_record(last_pred, games, last_pred_date, season_start)
+    return last_pred_date
 
+
+def update_record(last_pred, games, last_pred_date, season_start) -> PredictionRecord:
+    """
+    Fills in the final scores of the last prediction record, and its model
+    performance if it has none yet, and puts it back into DynamoDB.
+    """
     # Update the scores for the previous record
     updated_last_pred = update_scores(last_pred, games)
-
     pred_table_name = os.getenv('DYNAMODB_PRED_TABLE_NAME')
 
     # Update the model performance if it does not exist
@@ -314,4 +486,4 @@ def update_previous_record(
         )
 
     put_dynamodb_item(pred_table_name, updated_last_pred.model_dump())
-    return last_pred_date
+    return updated_last_pred
@@ -32,7 +32,9 @@ def main(season, start_date, end_date):
                 game_id = game["id"]
                 game_play_by_play = request_play_by_play_json(game_id)
                 play_by_play[game_id] = game_play_by_play
-                game_shifts = request_shifts_json(game["id"])
+                game_shifts = request_shifts_json(
+                    game["id"], final=game["gameState"] == "OFF"
+                )
                 shifts[game_id] = game_shifts
             days_progress = (
                 date.fromisoformat(next_game_date)
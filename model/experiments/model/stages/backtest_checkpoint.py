@@ -0,0 +1,99 @@
+import json
+import os
+
+from bayesbet.logger import get_logger
+from bayesbet.nhl.data_model import ModelState
+
+
+logger = get_logger(__name__)
+
+
+class BacktestCheckpoint:
+    """
+    Append only JSON lines store of the game days a backtest has completed,
+    so a restarted stage resumes after the last one. The first line records
+    the configuration the days were fit with, and a store written with a
+    different configuration is started over. It lives outside the DVC
+    outputs, which are removed before a stage runs, so delete it to refit
+    days after a change that affects them.
+    """
+    def __init__(self, path, config):
+        self.path = path
+        self.config = json.loads(json.dumps(config))
+        self.days = self.load()
+        self.file = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash while writing leaves a partial last line
+                    break
+        if not records or records[0] != {"config": self.config}:
+            logger.info(f"Checkpoint {self.path} has a different configuration, starting over")
+            return []
+        return records[1:]
+
+    @classmethod
+    def for_stage(cls, stage, params, initial_priors):
+        """The checkpoint of a backtest stage, keyed by its parameters."""
+        return cls(
+            f"results/checkpoints/{stage}.jsonl",
+            config={
+                "engine": params["engine"],
+                "model": params["model"],
+                "fit": params["fit"],
+                "initial_priors": initial_priors.model_dump(),
+            },
+        )
+
+    def resume(self, model, predictions, model_states, state_dates):
+        """
+        Adds the completed days to the predictions, model states and state
+        dates, restores the model to where the last one left it, and opens
+        the store to append the following days.
+        """
+        for day in self.days:
+            predictions[day["game_date"]] = day["predictions"]
+            model_states.append(ModelState.model_validate(day["model_state"]))
+            state_dates.append(day["game_date"])
+        if self.days:
+            model.priors = model_states[-1]
+            model.sampler_state = self.days[-1]["sampler_state"]
+            logger.info(f"Resuming after {len(self.days)} game days from {self.path}")
+        self.open()
+
+    def append_fit(self, game_date, predictions, posteriors, sampler_state):
+        """Records a completed game day's predictions and fit."""
+        self.append({
+            "game_date": game_date,
+            "predictions": predictions,
+            # Unrounded, unlike model_dump, so a resumed run fits the same priors
+            "model_state": {
+                "teams": posteriors.teams,
+                "variables": dict(posteriors.variables),
+            },
+            "sampler_state": sampler_state,
+        })
+
+    def open(self):
+        """Rewrites the store with the loaded days, then opens it to append."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            for record in [{"config": self.config}] + self.days:
+                f.write(json.dumps(record) + "\n")
+        self.file = open(self.path, "a")
+
+    def append(self, day):
+        self.file.write(json.dumps(day) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.days.append(day)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+import time
+
+import pandas as pd
+
+from bayesbet.nhl import codec
+from bayesbet.nhl.data_model import GamePrediction, PredictionRecord
+from bayesbet.nhl.history import ModelStateHistory
+
+
+def best_time(fn, repeats=5):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    """
+    Times the codec against model_dump_json and model_validate_json on the
+    prediction records of the training season, from the train stage outputs.
+    """
+    os.makedirs("results/benchmark", exist_ok=True)
+    with gzip.open("results/train/predictions.json.gz", "rb") as f:
+        predictions = json.loads(f.read())
+    history = ModelStateHistory.load("results/train/model_states")
+    state_idx = {d: k for k, d in enumerate(history.dates)}
+
+    # The record of each game day holds the state its predictions were made with
+    records = [
+        PredictionRecord(
+            league="nhl",
+            prediction_date=game_date,
+            deployment_version="benchmark",
+            league_state=history.league_state(state_idx[game_date] - 1),
+            predictions=[GamePrediction.model_validate(p) for p in game_preds],
+            prediction_performance=[],
+        )
+        for game_date, game_preds in predictions.items()
+    ]
+
+    encoders = {
+        "model_dump_json": lambda r: r.model_dump_json().encode("utf-8"),
+        "codec_json": codec.dumps,
+        "codec_binary": lambda r: codec.dumps(r, binary=True),
+    }
+    decoders = {
+        "model_dump_json": lambda b: PredictionRecord.model_validate_json(b),
+        "codec_json": lambda b: codec.loads(PredictionRecord, b),
+        "codec_binary": lambda b: codec.loads(PredictionRecord, b, binary=True),
+    }
+    trusted_decoders = {
+        "codec_json": lambda b: codec.loads(PredictionRecord, b, trusted=True),
+        "codec_binary": lambda b: codec.loads(
+            PredictionRecord, b, binary=True, trusted=True
+        ),
+    }
+
+    results = []
+    for name, encode in encoders.items():
+        encoded = [encode(r) for r in records]
+        decode = decoders[name]
+        results.append({
+            "codec": name,
+            "trusted": False,
+            "encode_time": best_time(lambda: [encode(r) for r in records]),
+            "decode_time": best_time(lambda: [decode(b) for b in encoded]),
+            "size_bytes": sum(len(b) for b in encoded),
+        })
+        if name in trusted_decoders:
+            decode = trusted_decoders[name]
+            results.append({**results[-1], "trusted": True, "decode_time": best_time(
+                lambda: [decode(b) for b in encoded]
+            )})
+
+    results = pd.DataFrame(results)
+    results.to_csv("results/benchmark/codec.csv", index=False)
+    print(f"{len(records)} prediction records")
+    print(results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import time
+
+import pandas as pd
+import yaml
+
+from bayesbet.nhl.data_model import ModelState, ModelVariables
+from bayesbet.nhl.data_utils import team_abbrevs
+from bayesbet.nhl.model import IterativeUpdateModel
+
+
+def main():
+    os.makedirs("results/benchmark", exist_ok=True)
+    with open("params.yaml", "r") as f:
+        params = yaml.safe_load(f)
+    benchmark_params = params["benchmark"]
+
+    n_teams = len(team_abbrevs)
+    initial_priors = ModelState(
+        teams = list(team_abbrevs.keys()),
+        variables = ModelVariables(
+            i=(1.0, 0.1),
+            h=(0.25, 0.1),
+            o=([0.0] * n_teams, [0.15] * n_teams),
+            d=([0.0] * n_teams, [0.15] * n_teams),
+        )
+    )
+
+    # The recorded game days to fit, the first only warms up the compilers
+    games = pd.read_parquet("../data/final/train/games.parquet")
+    games = games[games["game_state"] != "Postponed"]
+    game_dates = games["game_date"].sort_values().unique()
+    game_dates = game_dates[:benchmark_params["n_days"] + 1]
+
+    results = []
+    for backend in benchmark_params["sampler_backends"]:
+        model = IterativeUpdateModel(initial_priors.model_copy(deep=True), **params["model"])
+        for k, game_date in enumerate(game_dates):
+            current_games = games[games["game_date"] == game_date].reset_index(drop=True)
+            start = time.perf_counter()
+            model.fit(
+                current_games,
+                samples=benchmark_params["samples"],
+                tune=benchmark_params["tune"],
+                cores=1,
+                sampler_backend=backend,
+            )
+            wall_time = time.perf_counter() - start
+            ess = model.sampling_diagnostics["ess_bulk"]
+            results.append({
+                "sampler_backend": backend,
+                "game_date": game_date,
+                "n_games": len(current_games),
+                "warmup": k == 0,
+                "wall_time": wall_time,
+                "min_ess": ess,
+                "min_ess_per_second": ess / wall_time,
+            })
+
+    results = pd.DataFrame(results)
+    results.to_csv("results/benchmark/sampler_backends.csv", index=False)
+    summary = (
+        results[~results["warmup"]]
+        .groupby("sampler_backend")[["wall_time", "min_ess", "min_ess_per_second"]]
+        .median()
+    )
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from bayesbet.nhl.data_model import ModelState, ModelVariables
+from bayesbet.nhl.data_utils import team_abbrevs
+from bayesbet.nhl.evaluate import accuracy, log_loss
+from bayesbet.nhl.model import available_cores, model_engines
+
+
+# Loaded once before the workers fork, so they share them read-only
+games = {}
+
+
+def search_space(sweep_params):
+    """
+    The model configurations to evaluate. A grid search takes every
+    combination of the listed values, a random search draws n_samples
+    configurations uniformly from each [low, high] range.
+    """
+    space = sweep_params["space"]
+    names = list(space.keys())
+    if sweep_params["search"] == "grid":
+        return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+    elif sweep_params["search"] == "random":
+        rng = np.random.default_rng(sweep_params["seed"])
+        return [
+            {name: float(rng.uniform(*space[name])) for name in names}
+            for _ in range(sweep_params["n_samples"])
+        ]
+    raise ValueError(f"Unknown search {sweep_params['search']}!")
+
+
+def backtest(engine, model_params, fit_params):
+    """
+    Predicts and then fits every game day of the train and test games in
+    order, as the train and test stages do, and scores the predictions.
+    """
+    n_teams = len(team_abbrevs)
+    initial_priors = ModelState(
+        teams = list(team_abbrevs.keys()),
+        variables = ModelVariables(
+            i=(1.0, 0.1),
+            h=(0.25, 0.1),
+            o=([0.0] * n_teams, [0.15] * n_teams),
+            d=([0.0] * n_teams, [0.15] * n_teams),
+        )
+    )
+    model = model_engines[engine](initial_priors, **model_params)
+
+    start = time.perf_counter()
+    result = {**model_params}
+    for dataset_type in ("train", "test"):
+        dataset_games = games[dataset_type]
+        dataset_games = dataset_games[dataset_games["game_state"] != "Postponed"]
+        predictions = []
+        for _, current_games in dataset_games.groupby("game_date", sort=True):
+            current_games = current_games.reset_index(drop=True)
+            predictions += model.predict(current_games)
+            model.fit(current_games, **fit_params)
+        result[f"{dataset_type}_accuracy"] = accuracy(predictions)
+        result[f"{dataset_type}_log_loss"] = log_loss(predictions)
+        result[f"{dataset_type}_n_games"] = len(predictions)
+    result["wall_time"] = time.perf_counter() - start
+    return result
+
+
+def run_sweep(engine, configs, fit_params, workers):
+    # Each backtest samples its chains one after another in its own worker
+    fit_params = {**fit_params, "cores": 1}
+    mp_ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_ctx) as executor:
+        results = list(executor.map(
+            backtest,
+            itertools.repeat(engine),
+            configs,
+            itertools.repeat(fit_params),
+        ))
+    # The one step ahead predictions of the train games choose the
+    # configuration, the test games stay held out as in the evaluate stage
+    return pd.DataFrame(results).sort_values("train_log_loss", ignore_index=True)
+
+
+def main():
+    os.makedirs("results/sweep", exist_ok=True)
+    with open("params.yaml", "r") as f:
+        params = yaml.safe_load(f)
+    sweep_params = params["sweep"]
+    workers = sweep_params["workers"] or available_cores()
+
+    for dataset_type in ("train", "test"):
+        games[dataset_type] = pd.read_parquet(f"../data/final/{dataset_type}/games.parquet")
+
+    # Screen every configuration with the sweep's fit method, which can be a
+    # cheap approximation, then refit the best few with the finalist method
+    configs = [{**params["model"], **config} for config in search_space(sweep_params)]
+    fit_params = {**params["fit"], **sweep_params["fit"]}
+    results = run_sweep(params["engine"], configs, fit_params, workers)
+    results["stage"] = "screen"
+
+    finalists = sweep_params["finalists"]
+    if finalists["n"] > 0:
+        finalist_configs = results[list(params["model"].keys())].head(finalists["n"])
+        fit_params = {**params["fit"], **finalists["fit"]}
+        finalist_results = run_sweep(
+            params["engine"], finalist_configs.to_dict("records"), fit_params, workers
+        )
+        finalist_results["stage"] = "finalist"
+        results = pd.concat([results, finalist_results], ignore_index=True)
+
+    results.to_csv("results/sweep/results.csv", index=False)
+    print(results.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,10 @@ import pandas as pd
 from tqdm import tqdm
 import yaml
 
-from bayesbet.nhl.model import IterativeUpdateModel, ModelState
+from bayesbet.nhl.history import ModelStateHistory
+from bayesbet.nhl.model import model_engines
+
+from backtest_checkpoint import BacktestCheckpoint
 
 
 def main():
@@ -14,20 +17,26 @@ def main():
         params = yaml.safe_load(f)
 
     # Initialize model
-    with gzip.open('results/train/model_states.json.gz', 'rb') as f:
-        model_states_json = json.load(f)
-        last_model_state_json = model_states_json[-1]
-    initial_priors = ModelState.model_validate_json(last_model_state_json)
-    model = IterativeUpdateModel(initial_priors, **params["model"])
+    initial_priors = ModelStateHistory.load("results/train/model_states").model_state(-1)
+    model = model_engines[params["engine"]](initial_priors, **params["model"])
 
     # Import the testing games and find the unique game dates
     games = pd.read_parquet("../data/final/test/games.parquet")
     game_dates = games["game_date"].sort_values().unique()
 
+    # The model builds a new ModelState from its array state on each access
     predictions = {}
     model_states = [model.priors]
-    
+    state_dates = [""]
+
+    # Resume after the game days completed by an earlier run
+    checkpoint = BacktestCheckpoint.for_stage("test", params, model.priors)
+    checkpoint.resume(model, predictions, model_states, state_dates)
+
     for game_date in tqdm(game_dates):
+        if game_date in predictions:
+            continue
+
         # Game day predictions
         date_idx = (games["game_date"] == game_date) & (
             games["game_state"] != "Postponed"
@@ -38,24 +47,19 @@ def main():
         predictions[game_date] = date_predictions
 
         # Get games from the most recent game date played
-        posteriors = model.fit(current_games, cores=3)
+        posteriors = model.fit(current_games, **params["fit"])
         model_states.append(posteriors)
+        state_dates.append(game_date)
+        checkpoint.append_fit(game_date, date_predictions, posteriors, model.sampler_state)
+    checkpoint.close()
 
     predictions_json = json.dumps(predictions, indent=2).encode('utf-8')
     with gzip.open('results/test/predictions.json.gz', 'wb') as f:
         f.write(predictions_json)
 
-    model_states_json = [m.model_dump_json() for m in model_states]
-    model_states_json = json.dumps(model_states_json, indent=2).encode('utf-8')
-    with gzip.open('results/test/model_states.json.gz', 'wb') as f:
-        f.write(model_states_json)
-
-    # Generate matching LeagueStates from the model states
-    league_states = [m.to_league_state() for m in model_states]
-    league_states_json = [l.model_dump_json() for l in league_states]
-    league_states_json = json.dumps(league_states_json, indent=2).encode('utf-8')
-    with gzip.open('results/test/league_states.json.gz', 'wb') as f:
-        f.write(league_states_json)
+    # Columnar history of the model states, LeagueStates are loaded from it
+    history = ModelStateHistory.from_model_states(state_dates, model_states)
+    history.save("results/test/model_states")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,7 +6,11 @@ from tqdm import tqdm
 import yaml
 
 from bayesbet.nhl.data_utils import team_abbrevs
-from bayesbet.nhl.model import IterativeUpdateModel, ModelState, ModelVariables
+from bayesbet.nhl.data_model import ModelState, ModelVariables
+from bayesbet.nhl.history import ModelStateHistory
+from bayesbet.nhl.model import model_engines
+
+from backtest_checkpoint import BacktestCheckpoint
 
 
 def main():
@@ -25,16 +29,25 @@ def main():
             d=([0.0] * n_teams, [0.15] * n_teams),
         )
     )
-    model = IterativeUpdateModel(initial_priors, **params["model"])
+    model = model_engines[params["engine"]](initial_priors, **params["model"])
 
     # Import the training games and find the unique game dates
     games = pd.read_parquet("../data/final/train/games.parquet")
     game_dates = games["game_date"].sort_values().unique()
 
+    # The model builds a new ModelState from its array state on each access
     predictions = {}
     model_states = [model.priors]
-    
+    state_dates = [""]
+
+    # Resume after the game days completed by an earlier run
+    checkpoint = BacktestCheckpoint.for_stage("train", params, model.priors)
+    checkpoint.resume(model, predictions, model_states, state_dates)
+
     for game_date in tqdm(game_dates):
+        if game_date in predictions:
+            continue
+
         # Game day predictions
         date_idx = (games["game_date"] == game_date) & (
             games["game_state"] != "Postponed"
@@ -45,24 +58,19 @@ def main():
         predictions[game_date] = date_predictions
 
         # Get games from the most recent game date played
-        posteriors = model.fit(current_games, cores=3)
+        posteriors = model.fit(current_games, **params["fit"])
         model_states.append(posteriors)
+        state_dates.append(game_date)
+        checkpoint.append_fit(game_date, date_predictions, posteriors, model.sampler_state)
+    checkpoint.close()
 
     predictions_json = json.dumps(predictions, indent=2).encode('utf-8')
     with gzip.open('results/train/predictions.json.gz', 'wb') as f:
         f.write(predictions_json)
 
-    model_states_json = [m.model_dump_json() for m in model_states]
-    model_states_json = json.dumps(model_states_json, indent=2).encode('utf-8')
-    with gzip.open('results/train/model_states.json.gz', 'wb') as f:
-        f.write(model_states_json)
-
-    # Generate matching LeagueStates from the model states
-    league_states = [m.to_league_state() for m in model_states]
-    league_states_json = [l.model_dump_json() for l in league_states]
-    league_states_json = json.dumps(league_states_json, indent=2).encode('utf-8')
-    with gzip.open('results/train/league_states.json.gz', 'wb') as f:
-        f.write(league_states_json)
+    # Columnar history of the model states, LeagueStates are loaded from it
+    history = ModelStateHistory.from_model_states(state_dates, model_states)
+    history.save("results/train/model_states")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+import datetime as dt
+
+import numpy as np
+import pydantic
+import pytest
+
+from bayesbet.nhl import codec
+from bayesbet.nhl.data_model import (
+    LeagueState,
+    ModelState,
+    ModelStateRecord,
+    ModelVariables,
+    PredictionPerformance,
+    PredictionRecord,
+)
+from bayesbet.nhl.matchups import MatchupMatrix
+
+
+@pytest.fixture(scope="module")
+def model_state():
+    return ModelState(
+        teams=["A", "B", "C"],
+        variables=ModelVariables(
+            h=(0.25, 0.1),
+            i=(1.0, 0.123456789),
+            o=([0.1, 0.0, -0.1], [0.15, 0.05, 0.1]),
+            d=([0.0, 0.2, -0.2], [0.05, 0.1, 0.2]),
+        ),
+    )
+
+
+@pytest.fixture(scope="module")
+def prediction_record(model_state):
+    matchups = MatchupMatrix.from_model_state(model_state)
+    games = [
+        {"game_pk": 1, "game_type": "R", "game_state": "Final", "home_team": "A",
+         "away_team": "B", "home_fin_score": 3, "away_fin_score": 2},
+        {"game_pk": 2, "game_type": "P", "game_state": "Future", "home_team": "C",
+         "away_team": "A", "home_fin_score": 0, "away_fin_score": 0},
+    ]
+    return PredictionRecord(
+        league="nhl",
+        prediction_date="2024-01-02",
+        deployment_version="test",
+        league_state=model_state.to_league_state(),
+        predictions=[matchups.single_game_prediction(g) for g in games],
+        prediction_performance=[
+            PredictionPerformance(
+                prediction_date=dt.date(2024, 1, day),
+                total_games=10 * day,
+                cumulative_accuracy=0.6,
+                cumulative_log_loss=0.654321,
+                rolling_accuracy=0.55,
+                rolling_log_loss=0.7,
+            )
+            for day in (1, 2)
+        ],
+    )
+
+
+@pytest.mark.parametrize("binary", [False, True])
+@pytest.mark.parametrize("trusted", [False, True])
+def test_prediction_record_round_trip(prediction_record, binary, trusted):
+    data = codec.dumps(prediction_record, binary=binary)
+    decoded = codec.loads(PredictionRecord, data, binary=binary, trusted=trusted)
+    # Equal to the precision of the data model's serializers
+    assert decoded.model_dump() == prediction_record.model_dump()
+
+
+def test_model_state_record_round_trip(model_state):
+    record = ModelStateRecord(league="nhl", prediction_date="2024-01-02", state=model_state)
+    decoded = codec.loads(ModelStateRecord, codec.dumps(record), trusted=True)
+    assert decoded.model_dump() == record.model_dump()
+    assert decoded.state.variables.i == (1.0, 0.12346)
+
+
+def test_without_orjson(prediction_record, monkeypatch):
+    monkeypatch.setattr(codec, "orjson", None)
+    data = codec.dumps(prediction_record)
+    decoded = codec.loads(PredictionRecord, data)
+    assert decoded.model_dump() == prediction_record.model_dump()
+
+
+def test_orjson_matches_fallback(prediction_record, monkeypatch):
+    pytest.importorskip("orjson")
+    data = codec.dumps(prediction_record)
+    monkeypatch.setattr(codec, "orjson", None)
+    assert codec.dumps(prediction_record) == data
+
+
+def test_trusted_skips_checks(prediction_record, monkeypatch):
+    encoded = codec.encode(prediction_record)
+    encoded["predictions"]["win_percentages"] = np.full((2, 2, 3), 0.1)
+    monkeypatch.setattr(codec, "encode", lambda record: encoded)
+    data = codec.dumps(prediction_record)
+    with pytest.raises(pydantic.ValidationError):
+        codec.loads(PredictionRecord, data)
+    codec.loads(PredictionRecord, data, trusted=True)
+
+
+def test_trusted_construct(prediction_record):
+    data = codec.dumps(prediction_record)
+    decoded = codec.loads(PredictionRecord, data, trusted=True)
+    # Built without validation, but typed as a validated record would be
+    assert decoded == codec.loads(PredictionRecord, data)
+    assert decoded.prediction_date == dt.date(2024, 1, 2)
+    assert decoded.league_state.h == (0.25, 0.1)
+
+
+def test_legacy_json(prediction_record, model_state):
+    # Records the pipeline wrote before the codec, one string per float
+    data = prediction_record.model_dump_json().encode("utf-8")
+    decoded = codec.loads(PredictionRecord, data, trusted=True)
+    assert decoded.model_dump() == prediction_record.model_dump()
+    record = ModelStateRecord(league="nhl", prediction_date="2024-01-02", state=model_state)
+    decoded = codec.loads(ModelStateRecord, record.model_dump_json(), trusted=True)
+    assert decoded.model_dump() == record.model_dump()
+
+
+def test_unknown_record(model_state):
+    with pytest.raises(TypeError):
+        codec.encode(model_state)
+    with pytest.raises(TypeError):
+        codec.decode(LeagueState, {"league": "nhl", "prediction_date": "2024-01-02"})
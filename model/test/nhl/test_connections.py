@@ -0,0 +1,62 @@
+import fsspec
+import pytest
+
+from bayesbet.nhl import connections, db
+
+
+class LocalTable:
+    """A stand-in for a DynamoDB table that keeps the items in a dict."""
+    def __init__(self, name):
+        self.name = name
+        self.items = {}
+
+    def put_item(self, Item):
+        self.items[(Item["league"], Item["prediction_date"])] = Item
+        return {}
+
+
+class LocalDynamoDB:
+    def __init__(self):
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, LocalTable(name))
+
+
+@pytest.fixture(autouse=True)
+def clean_connections(monkeypatch):
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    monkeypatch.delenv("AWS_DYNAMODB_ENDPOINT_URL", raising=False)
+    monkeypatch.delenv("AWS_S3_ENDPOINT_URL", raising=False)
+    connections.reset()
+    yield
+    connections.reset()
+
+
+def test_dynamodb_cached():
+    resource = connections.dynamodb_resource()
+    assert connections.dynamodb_resource() is resource
+    table = connections.dynamodb_table("predictions")
+    assert connections.dynamodb_table("predictions") is table
+    assert connections.dynamodb_table("model_states") is not table
+    # Another endpoint gets its own resource
+    local = connections.dynamodb_resource(endpoint_url="http://localhost:8000")
+    assert local is not resource
+
+
+def test_s3_filesystem_cached():
+    s3 = connections.s3_filesystem()
+    assert connections.s3_filesystem() is s3
+    assert connections.s3_filesystem(region="us-west-2") is not s3
+
+
+def test_local_stand_ins():
+    dynamodb = LocalDynamoDB()
+    connections.use_dynamodb_resource(dynamodb)
+    item = {"league": "nhl", "prediction_date": "2023-10-10"}
+    db.put_dynamodb_item("predictions", item)
+    assert dynamodb.tables["predictions"].items == {("nhl", "2023-10-10"): item}
+
+    fs = fsspec.filesystem("memory")
+    connections.use_s3_filesystem(fs)
+    assert connections.s3_filesystem() is fs
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from bayesbet.nhl.data_model import ModelState, ModelVariables
+from bayesbet.nhl.history import ModelStateHistory
+
+
+@pytest.fixture
+def model_states():
+    return [
+        ModelState(
+            teams=["A", "B"],
+            variables=ModelVariables(
+                h=(0.25 + k, 0.1),
+                i=(1.0, 0.1 + k),
+                o=([0.1 * k, -0.1 * k], [0.15, 0.15]),
+                d=([0.0, 0.2 * k], [0.15, 0.1]),
+            ),
+        )
+        for k in range(4)
+    ]
+
+
+@pytest.fixture
+def history(model_states):
+    dates = ["", "2023-10-10", "2023-10-11", "2023-10-13"]
+    return ModelStateHistory.from_model_states(dates, model_states)
+
+
+class TestModelStateHistory:
+    def test_model_state(self, history, model_states):
+        for k, state in enumerate(model_states):
+            assert history.model_state(k) == state
+            assert history.league_state(k) == state.to_league_state()
+
+    def test_save_load(self, history, model_states, tmp_path):
+        history.save(tmp_path / "model_states")
+        loaded = ModelStateHistory.load(tmp_path / "model_states")
+        assert isinstance(loaded.team, np.memmap)
+        assert list(loaded.dates) == list(history.dates)
+        assert loaded.model_state() == model_states[-1]
+
+    def test_between(self, history, model_states):
+        sliced = history.between("2023-10-11", "2023-10-13")
+        assert list(sliced.dates) == ["2023-10-11", "2023-10-13"]
+        assert sliced.model_state(0) == model_states[2]
+        assert len(history.between(end="2023-10-10")) == 2
+        assert len(history.between("2023-10-12")) == 1
+
+    def test_series(self, history):
+        assert np.allclose(history.series("h_μ"), [0.25, 1.25, 2.25, 3.25])
+        assert np.allclose(history.series("d_μ", team="B"), [0.0, 0.2, 0.4, 0.6])
+
+    def test_different_teams(self, model_states):
+        model_states[1].teams = ["B", "A"]
+        with pytest.raises(ValueError):
+            ModelStateHistory.from_model_states(["", "2023-10-10"], model_states[:2])
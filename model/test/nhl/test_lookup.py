@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from bayesbet.nhl import quadrature
+from bayesbet.nhl.lookup import PredictionTable
+
+
+@pytest.fixture(scope="module")
+def prediction_table():
+    return PredictionTable.build(
+        σ_max=0.3,
+        pdf_steps=(0.02, 0.01),
+        ot_steps=(0.1, 0.045),
+        tol=1e-3,
+        n_check=2000,
+    )
+
+
+class TestPredictionTable:
+    def test_validation_error(self, prediction_table):
+        validation_error = prediction_table.meta["validation_error"]
+        assert set(validation_error) == {"score_pdf", "ot_win", "goal_within"}
+        assert max(validation_error.values()) < 1e-3
+
+    def test_tolerance(self):
+        with pytest.raises(ValueError):
+            PredictionTable.build(
+                pdf_steps=(0.1, 0.04), ot_steps=(0.5, 0.16), tol=1e-6, n_check=100
+            )
+
+    def test_interpolation(self, prediction_table):
+        μ = np.array([0.8, 1.0, 1.33])
+        σ = np.array([0.1, 0.15, 0.27])
+        expected = quadrature.poisson_pdf(μ, σ)
+        assert np.allclose(prediction_table.poisson_pdf(μ, σ), expected, atol=1e-3)
+        assert np.allclose(prediction_table.poisson_pdf(μ, σ).sum(axis=-1), 1.0)
+
+        params = (μ, σ, μ[::-1], σ[::-1])
+        assert np.allclose(
+            prediction_table.bernoulli_win_pdf(*params),
+            quadrature.bernoulli_win_pdf(*params),
+            atol=1e-3,
+        )
+        t = quadrature.t_before_shootout
+        assert np.allclose(
+            prediction_table.goal_within_time(t, *params),
+            quadrature.goal_within_time(t, *params),
+            atol=1e-3,
+        )
+
+    def test_overtime_probabilities(self, prediction_table):
+        t = quadrature.t_before_shootout
+        params = (1.0, 0.15, 0.8, 0.1)
+        pₕ_ot, p_ot_win, p_so_win = quadrature.overtime_probabilities(
+            t, *params, "R", engine=prediction_table
+        )
+        assert pₕ_ot == float(prediction_table.bernoulli_win_pdf(*params))
+        assert p_ot_win == float(prediction_table.goal_within_time(t, *params))
+        assert p_so_win == pytest.approx(1.0 - p_ot_win)
+
+    def test_out_of_range_fallback(self, prediction_table):
+        μ = np.array([1.0, 3.5])
+        σ = np.array([0.1, 0.5])
+        p = prediction_table.poisson_pdf(μ, σ)
+        assert np.allclose(p[1], quadrature.poisson_pdf(3.5, 0.5))
+        p_win = prediction_table.bernoulli_win_pdf(3.5, 0.1, 1.0, 0.1)
+        assert p_win == pytest.approx(quadrature.bernoulli_win_pdf(3.5, 0.1, 1.0, 0.1))
+
+    def test_save_load(self, prediction_table, tmp_path):
+        prediction_table.save(tmp_path / "table")
+        loaded = PredictionTable.load(tmp_path / "table")
+        assert loaded.meta == prediction_table.meta
+        assert isinstance(loaded.score_pdf, np.memmap)
+        assert np.array_equal(loaded.ot_win, prediction_table.ot_win)
+        assert np.allclose(
+            loaded.poisson_pdf(1.0, 0.1), prediction_table.poisson_pdf(1.0, 0.1)
+        )
+
+    def test_wrong_settings(self, prediction_table):
+        with pytest.raises(ValueError):
+            prediction_table.poisson_pdf(1.0, 0.1, max_y=12)
+        with pytest.raises(ValueError):
+            prediction_table.goal_within_time(1.0, 1.0, 0.1, 1.0, 0.1)
@@ -0,0 +1,81 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bayesbet.nhl.data_model import ModelState, ModelVariables
+from bayesbet.nhl.matchups import MatchupMatrix
+from bayesbet.nhl.model import IterativeUpdateModel
+
+
+@pytest.fixture(scope="module")
+def model_state():
+    teams = ["A", "B", "C", "D"]
+    return ModelState(
+        teams=teams,
+        variables=ModelVariables(
+            h=(0.1, 0.02),
+            i=(1.05, 0.02),
+            o=([0.1, 0.0, -0.05, -0.1], [0.05, 0.06, 0.07, 0.08]),
+            d=([0.0, 0.1, -0.1, 0.05], [0.05, 0.04, 0.06, 0.07]),
+        ),
+    )
+
+
+@pytest.fixture(scope="module")
+def matchups(model_state):
+    return MatchupMatrix.from_model_state(model_state)
+
+
+@pytest.fixture
+def games():
+    return pd.DataFrame({
+        "game_pk": [1, 2, 3],
+        "game_type": ["R", "R", "P"],
+        "game_state": ["Final", "Future", "Future"],
+        "home_team": ["A", "C", "D"],
+        "away_team": ["B", "A", "B"],
+        "home_fin_score": [3, 0, 0],
+        "away_fin_score": [2, 0, 0],
+    })
+
+
+def test_predict_batch(model_state, matchups, games):
+    model = IterativeUpdateModel(
+        model_state, delta_sigma=0.0, f_thresh=0.0, fattening_factor=1.0
+    )
+    assert matchups.predict_batch(games) == model.predict_batch(games)
+    game = games.to_dict(orient="records")[2]
+    assert matchups.single_game_prediction(game) == model.predict_batch(games)[2]
+
+
+def test_win_percentages(matchups):
+    # Every pairing sums to one, playoff games have no shootouts
+    total = matchups.win_percentages.sum(axis=(-2, -1))
+    assert np.allclose(total, 1.0, atol=1e-3)
+    assert np.all(matchups.win_percentages[1, ..., 2] == 0.0)
+
+
+def test_save_load(matchups):
+    f = io.BytesIO()
+    matchups.save(f)
+    f.seek(0)
+    loaded = MatchupMatrix.load(f)
+    assert loaded.teams == matchups.teams
+    assert np.array_equal(loaded.win_percentages, matchups.win_percentages)
+    assert np.array_equal(loaded.home_score_pdf, matchups.home_score_pdf)
+
+
+def test_series_odds(matchups):
+    # Against the brute force sum over every sequence of seven games
+    p_home = matchups.home_win_probability("A", "B", playoff=True)
+    p_away = 1.0 - matchups.home_win_probability("B", "A", playoff=True)
+    p = np.array([p_home, p_home, p_away, p_away, p_home, p_away, p_home])
+    outcomes = (np.arange(2 ** 7)[:, np.newaxis] >> np.arange(7)) & 1
+    p_sequences = np.prod(np.where(outcomes, p, 1.0 - p), axis=1)
+    expected = p_sequences[outcomes.sum(axis=1) >= 4].sum()
+    assert np.isclose(matchups.series_odds("A", "B"), expected)
+    assert np.isclose(matchups.series_odds("A", "B") + matchups.series_odds(
+        "B", "A", home_games=(2, 3, 5)
+    ), 1.0)
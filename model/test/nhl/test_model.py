@@ -1,11 +1,20 @@
 import numpy as np
 import pandas as pd
 import pytest
+from pymc.sampling.parallel import Draw
 
-from bayesbet.nhl.data_model import GamePrediction, LeagueState, TeamState
-from bayesbet.nhl.model import (
-    ModelVariables,
+from bayesbet.nhl.data_model import (
+    GamePrediction,
+    LeagueState,
     ModelState,
+    ModelVariables,
+    TeamState,
+)
+from bayesbet.nhl import model as model_module
+from bayesbet.nhl.lookup import PredictionTable
+from bayesbet.nhl.state import ModelStateArrays
+from bayesbet.nhl.model import (
+    AssumedDensityFilterModel,
     IterativeUpdateModel
 )
 
@@ -119,7 +128,18 @@ class TestIterativeUpdateModel:
             fattening_factor=1.05,
         )
         posteriors = model.get_model_posteriors(mock_trace)
-        assert posteriors == expected_posteriors
+        assert posteriors.to_model_state() == expected_posteriors
+
+    def test_get_model_posteriors_float32(self, mock_trace, mock_model_state):
+        model = IterativeUpdateModel(
+            mock_model_state,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        trace = {v: x.astype(np.float32) for v, x in mock_trace.items()}
+        posteriors = model.get_model_posteriors(trace)
+        assert posteriors.to_model_state() == mock_model_state
 
     def test_fatten_priors(self, mock_model_state):
         model = IterativeUpdateModel(
@@ -140,6 +160,23 @@ class TestIterativeUpdateModel:
         model.fatten_priors()
         assert model.priors == expected_priors
 
+    def test_priors_copied(self, mock_model_state):
+        state = ModelStateArrays.from_model_state(mock_model_state)
+        model = IterativeUpdateModel(
+            state,
+            delta_sigma=0.001,
+            f_thresh=0.75,
+            fattening_factor=2.0,
+        )
+        model.fatten_priors()
+        assert state.to_model_state() == mock_model_state
+        # Edits to the returned ModelState only apply once assigned back
+        priors = model.priors
+        priors.variables.o[0][0] = 0.5
+        assert model.priors.variables.o[0][0] == 0.0
+        model.priors = priors
+        assert model.priors.variables.o[0][0] == 0.5
+
     @pytest.mark.slow
     def test_fit(self, mock_game_data, mock_model_state_2):
         # Test with a small number of samples, just to verify model works
@@ -164,3 +201,435 @@ class TestIterativeUpdateModel:
         predictions = model.predict(mock_game_data)
         for prediction in predictions:
             assert isinstance(prediction, GamePrediction)
+
+    def test_predict_batch(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        predictions = model.predict_batch(mock_game_data)
+        for (_, game), prediction in zip(mock_game_data.iterrows(), predictions):
+            expected = model.single_game_prediction(game)
+            assert prediction.game_pk == expected.game_pk
+            assert prediction.outcome == expected.outcome
+            assert np.allclose(
+                prediction.score_probabilities.home,
+                expected.score_probabilities.home,
+            )
+            for team in ["home", "away"]:
+                win_p = getattr(prediction.win_percentages, team)
+                expected_win_p = getattr(expected.win_percentages, team)
+                for outcome in ["regulation", "overtime", "shootout"]:
+                    assert abs(
+                        getattr(win_p, outcome) - getattr(expected_win_p, outcome)
+                    ) < 1e-12
+
+    def test_predict_batch_arrays(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        playoff_games = mock_game_data.assign(game_type="P")
+        predictions = model.predict_batch(playoff_games, as_arrays=True)
+        assert predictions["score_probabilities"]["home"].shape == (3, 11)
+        assert np.all(predictions["win_percentages"]["home"]["shootout"] == 0.0)
+        total = sum(
+            predictions["win_percentages"][team][outcome]
+            for team in ["home", "away"]
+            for outcome in ["regulation", "overtime", "shootout"]
+        )
+        assert np.allclose(total, 1.0)
+
+    def test_predict_unknown_team(self, mock_game_data, mock_model_state):
+        model = IterativeUpdateModel(
+            mock_model_state,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        with pytest.raises(KeyError):
+            model.predict_batch(mock_game_data)
+
+    def test_predict_with_prediction_table(self, mock_game_data, mock_model_state_2):
+        table = PredictionTable.build(
+            pdf_steps=(0.02, 0.01), ot_steps=(0.1, 0.04), tol=1e-3, n_check=1000
+        )
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        expected = model.predict_batch(mock_game_data, as_arrays=True)
+        model.prediction_table = table
+        predictions = model.predict_batch(mock_game_data, as_arrays=True)
+        assert np.allclose(
+            predictions["score_probabilities"]["home"],
+            expected["score_probabilities"]["home"],
+            atol=1e-3,
+        )
+        assert np.allclose(
+            predictions["win_percentages"]["away"]["shootout"],
+            expected["win_percentages"]["away"]["shootout"],
+            atol=1e-3,
+        )
+        assert isinstance(model.single_game_prediction(mock_game_data.iloc[0]), GamePrediction)
+
+    def test_predict_batch_samples(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        with pytest.raises(ValueError):
+            model.predict_batch(mock_game_data, method="samples")
+
+        # Without the shared global parameters the home and away rates are
+        # independent and normal draws should reproduce the quadrature result
+        variables = mock_model_state_2.variables
+        variables.i = (variables.i[0], 1e-6)
+        variables.h = (variables.h[0], 1e-6)
+        model.priors = mock_model_state_2
+        rng = np.random.default_rng(0)
+        n_draws = 40000
+        model.posterior_samples = {
+            "h": rng.normal(*variables.h, size=n_draws),
+            "i": rng.normal(*variables.i, size=n_draws),
+            "o": rng.normal(*variables.o, size=(n_draws, 3)),
+            "d": rng.normal(*variables.d, size=(n_draws, 3)),
+        }
+        expected = model.predict_batch(mock_game_data, as_arrays=True)
+        predictions = model.predict_batch(
+            mock_game_data, as_arrays=True, method="samples"
+        )
+        assert np.allclose(
+            predictions["score_probabilities"]["home"],
+            expected["score_probabilities"]["home"],
+            atol=5e-3,
+        )
+        for team in ["home", "away"]:
+            for outcome in ["regulation", "overtime", "shootout"]:
+                assert np.allclose(
+                    predictions["win_percentages"][team][outcome],
+                    expected["win_percentages"][team][outcome],
+                    atol=5e-3,
+                )
+
+        thinned = model.predict_batch(mock_game_data, method="samples", n_samples=100)
+        for prediction in thinned:
+            assert isinstance(prediction, GamePrediction)
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize("method", ["advi", "fullrank_advi"])
+    def test_fit_variational(self, mock_game_data, mock_model_state_2, method):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        posteriors = model.fit(mock_game_data, method=method, max_iterations=5000)
+        assert isinstance(posteriors, ModelState)
+        assert posteriors.teams == mock_model_state_2.teams
+        assert model.posterior_samples["o"].shape == (5000, 3)
+
+    def test_build_model_reused(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        obs_data = model.model_ready_data(mock_game_data)
+        pm_model = model.build_model(obs_data)
+        model.state.μ[0] = 0.5
+        assert model.build_model(obs_data.iloc[:2]) is pm_model
+        # Only the data containers change between fits
+        assert pm_model["h_μ"].get_value() == 0.5
+        np.testing.assert_array_equal(pm_model["sₕ_obs"].get_value(), [1, 2])
+
+    def test_fit_laplace(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        posteriors = model.fit(mock_game_data, method="laplace", samples=1000)
+        assert isinstance(posteriors, ModelState)
+        assert posteriors.teams == mock_model_state_2.teams
+        # The team parameters stay centered
+        assert sum(posteriors.variables.o[0]) == pytest.approx(0.0, abs=1e-9)
+        assert sum(posteriors.variables.d[0]) == pytest.approx(0.0, abs=1e-9)
+        assert posteriors.variables.h[1] > 0.0
+        assert all(σ > 0.0 for σ in posteriors.variables.o[1])
+        assert model.posterior_samples["o"].shape == (1000, 3)
+        np.testing.assert_allclose(
+            model.posterior_samples["o"].sum(axis=1), 0.0, atol=1e-6
+        )
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize("sampler_backend", ["nutpie", "numpyro", "blackjax"])
+    def test_fit_sampler_backend(self, mock_game_data, mock_model_state_2, sampler_backend):
+        pytest.importorskip(sampler_backend)
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        posteriors = model.fit(
+            mock_game_data, samples=500, tune=500, sampler_backend=sampler_backend
+        )
+        assert isinstance(posteriors, ModelState)
+        assert model.posterior_samples["h"].shape == (1500,)
+        assert model.posterior_samples["o"].shape == (1500, 3)
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize("vectorized_backend", [None, "numpyro"])
+    def test_fit_without_multiprocessing(
+        self, monkeypatch, mock_game_data, mock_model_state_2, vectorized_backend
+    ):
+        if vectorized_backend is not None:
+            pytest.importorskip(vectorized_backend)
+        monkeypatch.setattr(model_module, "multiprocessing_context", lambda: None)
+        monkeypatch.setattr(
+            model_module, "vectorized_chains_backend", lambda: vectorized_backend
+        )
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        posteriors = model.fit(mock_game_data, samples=500, tune=500, cores=3)
+        assert isinstance(posteriors, ModelState)
+        assert model.posterior_samples["o"].shape == (1500, 3)
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize("cores", [1, 3])
+    def test_fit_adaptive(self, mock_game_data, mock_model_state_2, cores):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        model.fit(
+            mock_game_data,
+            samples=5000,
+            tune=500,
+            cores=cores,
+            adaptive=True,
+            block=250,
+            ess_target=200,
+            r_hat_target=1.05,
+        )
+        diagnostics = model.sampling_diagnostics
+        assert diagnostics["chains"] == 3
+        assert diagnostics["draws"] < 5000
+        assert diagnostics["draws"] % 250 == 0
+        assert model.posterior_samples["h"].shape == (3 * diagnostics["draws"],)
+
+    @pytest.mark.slow
+    def test_fit_sequential_then_parallel(self, mock_game_data, mock_model_state_2):
+        # Every fit builds and tunes its own NUTS step
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        model.fit(mock_game_data, samples=300, tune=200, cores=1)
+        model.fit(mock_game_data, samples=300, tune=200, cores=3)
+        assert model.sampling_diagnostics["draws"] == 300
+        assert model.posterior_samples["h"].shape == (900,)
+
+    @pytest.mark.slow
+    def test_fit_warm_start(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        model.fit(mock_game_data, samples=500, tune=500, cores=1)
+        sampler_state = model.sampler_state
+        n_params = 2 + 4 * len(mock_model_state_2.teams)
+        assert len(sampler_state["mean"]) == len(sampler_state["var"]) == n_params
+        assert sampler_state["step_size"] > 0.0
+        model.fit(mock_game_data, samples=500, tune=500, cores=1, warm_start=True, warm_tune=100)
+        assert model.sampling_diagnostics["r_hat"] < 1.05
+        assert model.sampler_state is not sampler_state
+
+    @pytest.mark.slow
+    def test_fit_warm_start_divergences(self, mock_game_data, mock_model_state_2):
+        # A far too large step size diverges, so the fit is tuned again
+        n_params = 2 + 4 * len(mock_model_state_2.teams)
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+            sampler_state={
+                "step_size": 100.0,
+                "mean": [0.0] * n_params,
+                "var": [100.0] * n_params,
+            },
+        )
+        model.fit(
+            mock_game_data, samples=300, tune=300, cores=1, warm_start=True, warm_tune=0
+        )
+        assert model.sampler_state["step_size"] < 100.0
+
+    @pytest.mark.slow
+    def test_fit_float32_trace(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        model.fit(mock_game_data, samples=300, tune=300, cores=1, trace_dtype="float32")
+        assert model.posterior_samples["o"].dtype == np.float32
+        assert model.posterior_samples["o"].shape == (900, len(mock_model_state_2.teams))
+        assert isinstance(model.priors.variables.h[0], float)
+
+    def test_nuts_step(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        pm_model = model.build_model(model.model_ready_data(mock_game_data))
+        n_params = 2 + 4 * len(mock_model_state_2.teams)
+        state = {"step_size": 0.5, "mean": [0.1] * n_params, "var": [0.01] * n_params}
+        step = model_module.nuts_step(pm_model, state)
+        assert step.step_size == pytest.approx(0.5)
+        assert np.allclose(step.potential.velocity(np.ones(n_params)), 0.01)
+        step = model_module.nuts_step(pm_model)
+        assert step.step_size == pytest.approx(0.25 / n_params**0.25)
+        assert np.allclose(step.potential.velocity(np.ones(n_params)), 1.0)
+        model.sampler_state = state
+        assert model.warm_start_state(pm_model) is state
+        model.sampler_state = {**state, "mean": [0.1]}
+        assert model.warm_start_state(pm_model) is None
+
+    def test_fit_unknown_sampler_backend(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        with pytest.raises(ValueError):
+            model.fit(mock_game_data, sampler_backend="stan")
+
+    def test_fit_unknown_method(self, mock_game_data, mock_model_state_2):
+        model = IterativeUpdateModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        with pytest.raises(ValueError):
+            model.fit(mock_game_data, method="metropolis")
+
+
+class TestAssumedDensityFilterModel:
+    def test_fit(self, mock_game_data, mock_model_state_2):
+        model = AssumedDensityFilterModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        posteriors = model.fit(mock_game_data, cores=3, method="nuts")
+        assert isinstance(posteriors, ModelState)
+        assert model.priors == posteriors
+        assert sum(posteriors.variables.o[0]) == pytest.approx(0.0, abs=1e-9)
+        assert sum(posteriors.variables.d[0]) == pytest.approx(0.0, abs=1e-9)
+        # Observing games only reduces the fattened prior uncertainty
+        assert posteriors.variables.i[1] < 0.075
+        assert all(σ < 0.075 for σ in posteriors.variables.o[1])
+
+    def test_game_update(self, mock_model_state_2):
+        model = AssumedDensityFilterModel(
+            mock_model_state_2,
+            delta_sigma=0.001,
+            f_thresh=0.075,
+            fattening_factor=1.05,
+        )
+        # (i, h, oₕ, dₐ, oₐ, dₕ)
+        μ = np.array([1.0, 0.3, 0.1, 0.25, 0.2, 0.15])
+        var = np.array([0.1, 0.1, 0.2, 0.2, 0.2, 0.2]) ** 2
+        sₕ, sₐ, hw = 5, 1, True
+        μ_post, var_post = model.game_update(μ, var, sₕ, sₐ, hw)
+
+        # Importance sampling reference from the prior
+        rng = np.random.default_rng(0)
+        θ = rng.normal(μ, np.sqrt(var), size=(1_000_000, 6))
+        log_λₕ, log_λₐ = model.rate_design @ θ.T
+        log_w = sₕ * log_λₕ - np.exp(log_λₕ) + sₐ * log_λₐ - np.exp(log_λₐ)
+        log_w -= np.logaddexp(0.0, log_λₐ - log_λₕ)
+        w = np.exp(log_w - log_w.max())
+        w /= w.sum()
+        μ_ref = w @ θ
+        var_ref = w @ (θ - μ_ref) ** 2
+        np.testing.assert_allclose(μ_post, μ_ref, atol=2e-3)
+        np.testing.assert_allclose(var_post, var_ref, rtol=2e-2)
+
+
+def test_sampling_diagnostics():
+    rng = np.random.default_rng(0)
+    diagnostics = model_module.sampling_diagnostics({
+        "h": rng.normal(size=(3, 1000)),
+        "o": rng.normal(size=(3, 1000, 4)),
+    })
+    assert diagnostics["ess_bulk"] > 2000
+    assert diagnostics["r_hat"] < 1.01
+    # A single chain is split in half for R-hat
+    diagnostics = model_module.sampling_diagnostics({"h": rng.normal(size=(1, 1000))})
+    assert np.isfinite(diagnostics["r_hat"])
+
+
+def test_draw_moments():
+    rng = np.random.default_rng(0)
+    draws = rng.normal(size=(50, 3))
+    moments = model_module.DrawMoments(["a", "b"])
+    moments(None, Draw(0, False, 0, True, [], {}))
+    for x in draws:
+        point = {"a": x[0], "b": x[1:]}
+        moments(None, Draw(0, False, 0, False, [], point))
+    assert np.allclose(moments.mean, draws.mean(axis=0))
+    assert np.allclose(moments.var, draws.var(axis=0))
+    # The last point is copied, parallel draws reuse their buffers
+    last_b = point["b"].copy()
+    point["b"][:] = 0.0
+    np.testing.assert_array_equal(moments.last_points[0]["b"], last_b)
+
+
+def test_available_cores():
+    assert model_module.available_cores() >= 1
+
+
+def test_multiprocessing_context():
+    mp_ctx = model_module.multiprocessing_context()
+    assert mp_ctx is not None
+    assert mp_ctx.get_start_method() == "fork"
+
+
+def test_shared_memory_arena(monkeypatch):
+    Arena = model_module.multiprocessing.heap.Arena
+    dir_candidates = Arena._dir_candidates
+    monkeypatch.setattr(model_module.os.path, "isdir", lambda path: False)
+    with model_module.shared_memory_arena():
+        assert Arena._dir_candidates == []
+    # Other multiprocessing users keep /dev/shm
+    assert Arena._dir_candidates is dir_candidates
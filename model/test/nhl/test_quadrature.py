@@ -0,0 +1,89 @@
+from math import factorial, sqrt, pi
+import numpy as np
+import pytest
+from scipy.integrate import quad, dblquad
+
+from bayesbet.nhl.quadrature import (
+    bernoulli_win_pdf,
+    goal_within_time,
+    overtime_probabilities,
+    poisson_pdf,
+)
+
+
+def quad_poisson_pdf(μ, σ, max_y=10):
+    def integrand(x, y, σ, μ):
+        pois = (np.exp(x)**y)*np.exp(-np.exp(x))/factorial(y)
+        norm = np.exp(-0.5*((x-μ)/σ)**2.0)/(σ * sqrt(2.0*pi))
+        return pois * norm
+
+    p = [quad(integrand, -3.0, 5.0, args=(y, σ, μ))[0] for y in range(max_y)]
+    p.append(1.0 - sum(p))
+    return np.array(p)
+
+
+def quad_normal_expectation(f, log_λₕ_μ, log_λₕ_σ, log_λₐ_μ, log_λₐ_σ):
+    def dblintegrand(y, x):
+        normₕ = np.exp(-0.5*((x-log_λₕ_μ)/log_λₕ_σ)**2)/(log_λₕ_σ * sqrt(2*pi))
+        normₐ = np.exp(-0.5*((y-log_λₐ_μ)/log_λₐ_σ)**2)/(log_λₐ_σ * sqrt(2*pi))
+        return normₐ*normₕ*f(np.exp(x), np.exp(y))
+
+    return dblquad(dblintegrand, -3.0, 5.0, -3.0, 5.0)[0]
+
+
+class TestPoissonPdf:
+    @pytest.mark.parametrize("μ", [-0.5, 0.5, 1.0, 1.25, 2.0])
+    @pytest.mark.parametrize("σ", [0.05, 0.1, 0.25, 0.5])
+    def test_matches_adaptive_quadrature(self, μ, σ):
+        expected = quad_poisson_pdf(μ, σ)
+        assert np.allclose(poisson_pdf(μ, σ), expected, rtol=0.0, atol=1e-6)
+
+    def test_sums_to_one(self):
+        p = poisson_pdf(1.0, 0.2)
+        assert p.shape == (11,)
+        assert abs(p.sum() - 1.0) < 1e-12
+
+    def test_vectorized(self):
+        μ = np.array([0.8, 1.0, 1.2])
+        σ = np.array([0.1, 0.2, 0.3])
+        p = poisson_pdf(μ, σ, max_y=8)
+        assert p.shape == (3, 9)
+        for k in range(3):
+            assert np.allclose(p[k], poisson_pdf(μ[k], σ[k], max_y=8))
+
+
+game_params = [
+    (1.25, 0.15, 1.0, 0.12),
+    (0.9, 0.2, 1.3, 0.1),
+    (1.0, 0.05, 1.0, 0.3),
+]
+
+
+class TestOvertimeProbabilities:
+    @pytest.mark.parametrize("params", game_params)
+    def test_bernoulli_win_pdf(self, params):
+        expected = quad_normal_expectation(lambda λₕ, λₐ: λₕ/(λₕ + λₐ), *params)
+        assert abs(bernoulli_win_pdf(*params) - expected) < 1e-6
+
+    @pytest.mark.parametrize("params", game_params)
+    def test_goal_within_time(self, params):
+        t = 5.0/60.0
+        expected = quad_normal_expectation(
+            lambda λₕ, λₐ: 1 - np.exp(-1*(λₕ*t + λₐ*t)), *params
+        )
+        assert abs(goal_within_time(t, *params) - expected) < 1e-6
+
+    def test_vectorized(self):
+        params = np.array(game_params).T
+        p = bernoulli_win_pdf(*params)
+        assert p.shape == (3,)
+        for k, game in enumerate(game_params):
+            assert abs(p[k] - bernoulli_win_pdf(*game)) < 1e-12
+
+    def test_overtime_probabilities(self):
+        t = 5.0/60.0
+        pₕ_ot, p_ot_win, p_so_win = overtime_probabilities(t, *game_params[0], "R")
+        assert abs(pₕ_ot - bernoulli_win_pdf(*game_params[0])) < 1e-12
+        assert abs(p_ot_win - goal_within_time(t, *game_params[0])) < 1e-12
+        assert abs(p_ot_win + p_so_win - 1.0) < 1e-12
+        assert overtime_probabilities(t, *game_params[0], "P")[1:] == (1.0, 0.0)
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bayesbet.nhl.data_utils import team_abbrevs, team_divisions
+from bayesbet.nhl.data_model import ModelState, ModelVariables
+from bayesbet.nhl.simulate import season_schedule, simulate_season
+
+
+@pytest.fixture(scope="module")
+def model_state():
+    teams = list(team_abbrevs.keys())
+    rng = np.random.default_rng(0)
+    return ModelState(
+        teams=teams,
+        variables=ModelVariables(
+            h=(0.1, 0.02),
+            i=(1.05, 0.02),
+            o=(rng.normal(0.0, 0.1, len(teams)).tolist(), [0.05] * len(teams)),
+            d=(rng.normal(0.0, 0.1, len(teams)).tolist(), [0.05] * len(teams)),
+        ),
+    )
+
+
+@pytest.fixture(scope="module")
+def season_games(model_state):
+    # Every team plays once a day, the first half of the days are played
+    rng = np.random.default_rng(1)
+    games = []
+    for day in range(20):
+        teams = rng.permutation(model_state.teams)
+        for home_team, away_team in zip(teams[::2], teams[1::2]):
+            final = day < 10
+            home_reg_score, away_reg_score = rng.poisson(3, 2) if final else (0, 0)
+            tie = home_reg_score == away_reg_score
+            games.append({
+                "game_type": "R",
+                "game_state": "Final" if final else "Future",
+                "home_team": home_team,
+                "away_team": away_team,
+                "home_reg_score": home_reg_score,
+                "away_reg_score": away_reg_score,
+                "home_fin_score": home_reg_score + (final and tie),
+                "away_fin_score": away_reg_score,
+            })
+    return pd.DataFrame(games)
+
+
+def test_completed_standings(model_state, season_games):
+    completed = season_games[season_games["game_state"] == "Final"]
+    simulation = simulate_season(model_state, completed, n_simulations=10, seed=0)
+    for k, team in enumerate(model_state.teams):
+        home = completed[completed["home_team"] == team]
+        away = completed[completed["away_team"] == team]
+        home_ot = home["home_reg_score"] == home["away_reg_score"]
+        away_ot = away["home_reg_score"] == away["away_reg_score"]
+        points = (
+            2 * (home["home_fin_score"] > home["away_fin_score"]).sum()
+            + 2 * (away["away_fin_score"] > away["home_fin_score"]).sum()
+            + (home_ot & (home["home_fin_score"] < home["away_fin_score"])).sum()
+            + (away_ot & (away["away_fin_score"] < away["home_fin_score"])).sum()
+        )
+        assert np.all(simulation.points[:, k] == points)
+
+
+@pytest.mark.parametrize("rating_uncertainty", [False, True])
+def test_playoff_seeds(model_state, season_games, rating_uncertainty):
+    simulation = simulate_season(
+        model_state,
+        season_games,
+        n_simulations=2000,
+        rating_uncertainty=rating_uncertainty,
+        seed=0,
+        chunk_size=500,
+    )
+    # Three division seeds per division and two wild cards per conference
+    assert np.all((simulation.seeds >= 0).sum(axis=1) == 16)
+    for seed, count in zip(range(5), (4, 4, 4, 2, 2)):
+        assert np.all((simulation.seeds == seed).sum(axis=1) == count)
+    # Division winners have the most points in their division
+    divisions = np.array([team_divisions[t] for t in model_state.teams])
+    for division in set(divisions):
+        idx = np.flatnonzero(divisions == division)
+        winner = idx[np.argmax(simulation.seeds[:, idx] == 0, axis=1)]
+        points = simulation.points[np.arange(2000), winner]
+        assert np.all(points == simulation.points[:, idx].max(axis=1))
+
+    summary = simulation.summary()
+    assert np.isclose(summary["playoff_odds"].sum(), 16.0)
+    assert np.allclose(simulation.points_distribution().sum(axis=0), 1.0)
+
+
+def test_expected_points(model_state, season_games):
+    schedule = season_schedule(model_state, season_games)
+    simulation = simulate_season(model_state, season_games, n_simulations=20000, seed=0)
+    p = schedule["outcome_p"]
+    home_points = 2 * (p[:, 0] + p[:, 2]) + p[:, 3]
+    away_points = 2 * (p[:, 1] + p[:, 3]) + p[:, 2]
+    expected = schedule["points"].astype(float)
+    np.add.at(expected, schedule["idₕ"], home_points)
+    np.add.at(expected, schedule["idₐ"], away_points)
+    assert np.allclose(simulation.points.mean(axis=0), expected, atol=0.1)
+
+
+def test_parallel_reproducible(model_state, season_games):
+    kwargs = dict(n_simulations=1000, seed=3, chunk_size=250)
+    serial = simulate_season(model_state, season_games, cores=1, **kwargs)
+    parallel = simulate_season(model_state, season_games, cores=2, **kwargs)
+    assert np.array_equal(serial.points, parallel.points)
+    assert np.array_equal(serial.seeds, parallel.seeds)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from bayesbet.nhl.data_model import ModelState, ModelVariables
+from bayesbet.nhl.state import ModelStateArrays
+
+
+@pytest.fixture
+def model_state():
+    return ModelState(
+        teams=["A", "B", "C"],
+        variables=ModelVariables(
+            h=(0.25, 0.1),
+            i=(1.0, 0.2),
+            o=([0.1, 0.0, -0.1], [0.15, 0.05, 0.1]),
+            d=([0.0, 0.2, -0.2], [0.05, 0.1, 0.2]),
+        ),
+    )
+
+
+class TestModelStateArrays:
+    def test_model_state_round_trip(self, model_state):
+        state = ModelStateArrays.from_model_state(model_state)
+        assert np.array_equal(state.μ, [0.25, 1.0, 0.1, 0.0, -0.1, 0.0, 0.2, -0.2])
+        assert state.to_model_state() == model_state
+
+    def test_league_state_round_trip(self, model_state):
+        league_state = model_state.to_league_state()
+        state = ModelStateArrays.from_league_state(league_state)
+        assert state.to_league_state() == league_state
+        assert state.to_model_state() == model_state
+
+    def test_views(self, model_state):
+        state = ModelStateArrays.from_model_state(model_state)
+        state.d_σ[1] = 0.5
+        assert state.σ[6] == 0.5
+        assert np.shares_memory(state.o_μ, state.μ)
+        copied = state.copy()
+        copied.o_μ[:] = 0.0
+        assert state.o_μ[0] == 0.1
+
+    def test_fatten(self, model_state):
+        state = ModelStateArrays.from_model_state(model_state)
+        state.fatten(2.0, 0.25)
+        assert np.allclose(state.σ, [0.2, 0.25, 0.25, 0.1, 0.2, 0.1, 0.2, 0.25])
+
+    def test_team_indices(self, model_state):
+        state = ModelStateArrays.from_model_state(model_state)
+        idₕ, idₐ = state.team_indices(["C", "A"], ["B", "C"])
+        assert idₕ.tolist() == [2, 0]
+        assert idₐ.tolist() == [1, 2]
+        with pytest.raises(KeyError):
+            state.team_indices(["D"], ["A"])
+
+    def test_wrong_length(self):
+        with pytest.raises(ValueError):
+            ModelStateArrays(["A", "B"], np.zeros(5), np.ones(5))
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+import requests
+import simplejson as json
+from requests.adapters import BaseAdapter
+
+from bayesbet.nhl import stats_api
+
+
+class LocalAdapter(BaseAdapter):
+    """Serves canned responses by URL and records the requests it gets."""
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = responses
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, headers, body = self.responses[request.url]
+        if "ETag" in headers and request.headers.get("If-None-Match") == headers["ETag"]:
+            status, body = 304, None
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = io.BytesIO(json.dumps(body).encode("utf-8") if body else b"")
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def adapter(monkeypatch, tmp_path):
+    adapter = LocalAdapter({})
+    session = requests.Session()
+    session.mount("https://", adapter)
+    monkeypatch.setattr(stats_api, "_session", session)
+    monkeypatch.setattr(stats_api, "cache_dir", str(tmp_path))
+    return adapter
+
+
+def test_etag_revalidation(adapter):
+    url = f"{stats_api.base_url}/v1/score/2023-10-10"
+    adapter.responses[url] = (200, {"ETag": '"v1"'}, {"games": [1]})
+    assert stats_api.request_games_json("2023-10-10") == {"games": [1]}
+    assert stats_api.request_games_json("2023-10-10") == {"games": [1]}
+    assert len(adapter.requests) == 2
+    assert adapter.requests[1].headers["If-None-Match"] == '"v1"'
+
+
+def test_final_games_immutable(adapter):
+    live_url = f"{stats_api.base_url}/v1/gamecenter/1/play-by-play"
+    final_url = f"{stats_api.base_url}/v1/gamecenter/2/play-by-play"
+    adapter.responses[live_url] = (200, {}, {"gameState": "LIVE"})
+    adapter.responses[final_url] = (200, {}, {"gameState": "OFF"})
+    for _ in range(2):
+        stats_api.request_play_by_play_json(1)
+        stats_api.request_play_by_play_json(2)
+    assert [r.url for r in adapter.requests] == [live_url, final_url, live_url]
+
+
+def test_season_start_date(adapter):
+    url = f"{stats_api.base_url}/v1/standings-season/"
+    adapter.responses[url] = (200, {}, {"seasons": [
+        {"id": 20222023, "standingsStart": "2022-10-07"},
+    ]})
+    assert stats_api.get_season_start_date(20222023) == "2022-10-07"
+    assert stats_api.get_season_start_date(20222023) == "2022-10-07"
+    assert len(adapter.requests) == 1
+
+    # A season missing from the cached list refreshes it
+    adapter.responses[url] = (200, {}, {"seasons": [
+        {"id": 20222023, "standingsStart": "2022-10-07"},
+        {"id": 20232024, "standingsStart": "2023-10-10"},
+    ]})
+    assert stats_api.get_season_start_date(20232024) == "2023-10-10"
+    assert len(adapter.requests) == 2
+
+
+def test_error_status(adapter):
+    url = f"{stats_api.base_url}/v1/score/2023-10-10"
+    adapter.responses[url] = (404, {}, {"message": "Not Found"})
+    with pytest.raises(requests.HTTPError):
+        stats_api.request_games_json("2023-10-10")
@@ -0,0 +1,112 @@
+import fsspec
+import numpy as np
+import pandas as pd
+import pytest
+
+from bayesbet.nhl import tasks
+from bayesbet.nhl.data_utils import game_schema, write_games
+from bayesbet.nhl.data_model import GamePrediction, ModelState, ModelVariables
+from bayesbet.nhl.model import IterativeUpdateModel
+
+
+@pytest.fixture
+def model_state():
+    return ModelState(
+        teams=["A", "B", "C"],
+        variables=ModelVariables(
+            h=(0.3, 0.5),
+            i=(1.0, 0.5),
+            o=([0.1, 0.2, 0.3], [0.2, 0.2, 0.2]),
+            d=([0.15, 0.25, 0.3], [0.2, 0.2, 0.2]),
+        ),
+    )
+
+
+@pytest.fixture
+def games_to_predict():
+    return pd.DataFrame({
+        "game_pk": [1, 2, 3, 4, 5],
+        "game_type": ["R", "R", "R", "P", "P"],
+        "game_state": ["Preview"] * 5,
+        "home_team": ["A", "C", "C", "B", "A"],
+        "home_reg_score": [0] * 5,
+        "home_fin_score": [0] * 5,
+        "away_team": ["B", "B", "A", "C", "C"],
+        "away_reg_score": [0] * 5,
+        "away_fin_score": [0] * 5,
+    })
+
+
+@pytest.fixture
+def ingested_games():
+    return pd.DataFrame({
+        "game_pk": [2023020001, 2023020002, 2023020003],
+        "game_date": ["2023-10-10"] * 3,
+        "season": [20232024] * 3,
+        "game_type": ["R", "R", np.nan],
+        "game_state": ["Final", "Postponed", np.nan],
+        "home_team": ["A", "C", np.nan],
+        "home_reg_score": [1, 0, 2],
+        "home_fin_score": [2, 0, 2],
+        "away_team": ["B", "B", "A"],
+        "away_reg_score": [1, 0, 5],
+        "away_fin_score": [1, 0, 5],
+        "win_type": ["OT", "NA", "REG"],
+    })
+
+
+@pytest.mark.parametrize("extension", ["parquet", "csv"])
+def test_read_ingested_games(tmp_path, ingested_games, extension):
+    if extension == "parquet":
+        write_games(ingested_games, str(tmp_path / "games.parquet"))
+    else:
+        # Ingested by a run from before the Parquet intermediates
+        ingested_games.to_csv(tmp_path / "games.csv", index=False)
+    fs = fsspec.filesystem("file")
+
+    games = tasks.read_ingested_games(fs, str(tmp_path), "games")
+    assert games.columns.tolist() == game_schema.names
+    assert games["game_pk"].dtype == np.int64
+    assert games["home_fin_score"].dtype == np.int64
+    assert games["game_date"].tolist() == ingested_games["game_date"].tolist()
+    assert games["home_team"].isna().tolist() == [False, False, True]
+
+    games = tasks.read_ingested_games(fs, str(tmp_path), "games", tasks.update_columns)
+    assert games.columns.tolist() == tasks.update_columns
+    assert games["home_fin_score"].astype(str).tolist() == ["2", "0", "2"]
+
+
+def test_predict_slate(model_state, games_to_predict):
+    predictions = tasks.predict_slate(games_to_predict, model_state)
+    model = IterativeUpdateModel(
+        model_state,
+        delta_sigma=tasks.delta_sigma,
+        f_thresh=tasks.f_thresh,
+        fattening_factor=tasks.fattening_factor,
+    )
+    assert len(predictions) == len(games_to_predict)
+    for (_, game), prediction in zip(games_to_predict.iterrows(), predictions):
+        expected = model.single_game_prediction(game)
+        # Equal once rounded by the data model's serializers
+        assert prediction.model_dump() == expected.model_dump()
+
+
+def test_predict_slate_chunked(model_state, games_to_predict):
+    predictions = tasks.predict_slate(games_to_predict, model_state)
+    chunked = tasks.predict_slate(games_to_predict, model_state, chunk_size=2)
+    assert chunked == predictions
+
+
+def test_predict_slate_empty(model_state, games_to_predict):
+    assert tasks.predict_slate(games_to_predict.iloc[:0], model_state) == []
+    assert tasks.predict_games([], model_state.model_dump()) == []
+
+
+def test_predict_games(model_state, games_to_predict):
+    # The step function passes the records of games_to_predict and the state
+    games = games_to_predict.to_dict(orient="records")
+    predictions = tasks.predict_games(games, model_state.model_dump())
+    assert [p["game_pk"] for p in predictions] == games_to_predict["game_pk"].tolist()
+    for prediction, game in zip(predictions, games):
+        assert prediction == tasks.predict_game(game, model_state.model_dump())
+        GamePrediction.model_validate(prediction)